@@ -0,0 +1,82 @@
+import asyncio
+
+from telegram import Bot, Update
+from telegram.constants import ChatMemberStatus
+from telegram.ext import ContextTypes
+
+from cache import TTLCache
+from config import ADMIN_CACHE_TTL, ADMIN_CACHE_SIZE
+
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+# chat_id -> {user_id: status}
+_admins = TTLCache(maxsize=ADMIN_CACHE_SIZE, ttl=ADMIN_CACHE_TTL)
+# درخواست‌های در جریان تا چند دستور همزمان فقط یک بار API را صدا بزنند
+_pending = {}
+
+
+async def _fetch_admins(bot: Bot, chat_id: int):
+    try:
+        members = await bot.get_chat_administrators(chat_id)
+        admins = {member.user.id: member.status for member in members}
+        _admins.set(chat_id, admins)
+        return admins
+    finally:
+        _pending.pop(chat_id, None)
+
+
+async def get_admins(bot: Bot, chat_id: int):
+    admins = _admins.get(chat_id)
+    if admins is not None:
+        return admins
+
+    task = _pending.get(chat_id)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_admins(bot, chat_id))
+        _pending[chat_id] = task
+    return await asyncio.shield(task)
+
+
+async def is_admin(bot: Bot, chat_id: int, user_id: int) -> bool:
+    return user_id in await get_admins(bot, chat_id)
+
+
+async def get_member_status(bot: Bot, chat_id: int, user_id: int) -> str:
+    # هر کسی که در لیست ادمین‌ها نباشد عضو عادی حساب می‌شود
+    admins = await get_admins(bot, chat_id)
+    return admins.get(user_id, ChatMemberStatus.MEMBER)
+
+
+def invalidate(chat_id: int):
+    _admins.pop(chat_id)
+
+
+# به‌روزرسانی کش با رویدادهای ChatMember (ارتقا، عزل، خروج)
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    change = update.chat_member or update.my_chat_member
+    if not change:
+        return
+
+    chat_id = change.chat.id
+    user_id = change.new_chat_member.user.id
+    new_status = change.new_chat_member.status
+
+    admins = _admins.get(chat_id)
+    if admins is None:
+        return
+
+    if new_status in ADMIN_STATUSES:
+        if admins.get(user_id) == new_status:
+            return
+        admins = {**admins, user_id: new_status}
+    elif user_id in admins:
+        admins = {uid: status for uid, status in admins.items() if uid != user_id}
+    else:
+        return
+
+    if new_status == ChatMemberStatus.OWNER or change.old_chat_member.status == ChatMemberStatus.OWNER:
+        # انتقال مالکیت دو نفر را تغییر می‌دهد؛ لیست کامل دوباره گرفته شود
+        invalidate(chat_id)
+        return
+
+    _admins.set(chat_id, admins)
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+
+from config import AUDIT_BATCH, AUDIT_FLUSH_INTERVAL, AUDIT_MAX_BUFFER
+from database import insert_audit_events, iter_audit_events
+
+# انواع اقدام
+WARN = "warn"
+UNWARN = "unwarn"
+MUTE = "mute"
+UNMUTE = "unmute"
+BAN = "ban"
+UNBAN = "unban"
+PURGE = "purge"
+LOCK = "lock"
+UNLOCK = "unlock"
+AUTO_UNLOCK = "auto_unlock"
+NIGHT_LOCK_APPLY = "night_lock_apply"
+NIGHT_LOCK_RELEASE = "night_lock_release"
+FLOOD_MUTE = "flood_mute"
+LINK_DELETED = "link_deleted"
+BANNED_WORD_DELETED = "banned_word_deleted"
+SPAM_DELETED = "spam_deleted"
+
+# رویدادهای ارسال‌نشده؛ هر AUDIT_BATCH رویداد یا هر AUDIT_FLUSH_INTERVAL ثانیه با یک درخواست نوشته می‌شوند
+_buffer = []
+_flush_now = asyncio.Event()
+_flush_lock = asyncio.Lock()  # دو ارسال همزمان یک دسته را دو بار برندارند
+_flusher: asyncio.Task = None
+
+
+def record(group_id: int, action: str, actor_id: int = None, target_id: int = None, **details):
+    # فقط اضافه کردن به حافظه؛ هیچ درخواستی در مسیر هندلر انجام نمی‌شود
+    _buffer.append({
+        "event_id": str(uuid.uuid4()),
+        "group_id": group_id,
+        "action": action,
+        "actor_id": actor_id,
+        "target_id": target_id,
+        "details": details or None,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    })
+    if len(_buffer) >= AUDIT_BATCH:
+        _flush_now.set()
+
+
+async def flush(full_batches_only: bool = False):
+    async with _flush_lock:
+        return await _flush(AUDIT_BATCH if full_batches_only else 1)
+
+
+async def _flush(minimum: int):
+    global _buffer
+    while len(_buffer) >= minimum:
+        batch = _buffer[:AUDIT_BATCH]
+        if not await insert_audit_events(batch):
+            # در حافظه می‌ماند تا دفعه بعد؛ هنگام قطعی طولانی قدیمی‌ترین‌ها کنار گذاشته می‌شوند
+            if len(_buffer) > AUDIT_MAX_BUFFER:
+                dropped = len(_buffer) - AUDIT_MAX_BUFFER
+                _buffer = _buffer[dropped:]
+                print(f"⚠️ {dropped} رویداد گزارش اقدامات به دلیل قطعی Supabase کنار گذاشته شد.")
+            return False
+        # رویدادهایی که حین ارسال اضافه شده‌اند حفظ می‌شوند
+        _buffer = _buffer[len(batch):]
+    return True
+
+
+def pending() -> int:
+    return len(_buffer)
+
+
+def start():
+    global _flusher
+    if _flusher is None:
+        _flusher = asyncio.create_task(_flush_forever())
+
+
+async def stop(timeout: float = 5):
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        await asyncio.gather(_flusher, return_exceptions=True)
+        _flusher = None
+    try:
+        await asyncio.wait_for(flush(), timeout)
+    except Exception as e:
+        print(f"⚠️ ارسال نهایی گزارش اقدامات ناموفق بود: {e}")
+    if _buffer:
+        print(f"⚠️ {len(_buffer)} رویداد گزارش اقدامات ارسال نشد.")
+
+
+async def _flush_forever():
+    while True:
+        # با پر شدن دسته فقط دسته‌های کامل و با گذشت زمان همه رویدادها ارسال می‌شوند
+        try:
+            await asyncio.wait_for(_flush_now.wait(), AUDIT_FLUSH_INTERVAL)
+            full_batches_only = True
+        except asyncio.TimeoutError:
+            full_batches_only = False
+        _flush_now.clear()
+        try:
+            await flush(full_batches_only)
+        except Exception as e:
+            print(f"❌ خطا در ارسال گزارش اقدامات: {e}")
+
+
+async def export(group_id: int, after: int = 0, limit: int = None):
+    # هر رویداد یک خط JSON (NDJSON)؛ رویدادهای هنوز ارسال‌نشده هم قبل از خواندن نوشته می‌شوند
+    await flush()
+    async for row in iter_audit_events(group_id, after, limit):
+        yield json.dumps(row, ensure_ascii=False) + "\n"
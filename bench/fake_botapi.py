@@ -0,0 +1,81 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+from fastapi import FastAPI, Request
+
+# شبیه‌ساز Bot API؛ هر متد فقط شمرده می‌شود و یک پاسخ معتبر ساختگی برمی‌گرداند
+
+BOT_ID = 1
+OWNER_ID = 2  # مالک همه گروه‌ها؛ کاربرهای دیگر عضو عادی هستند
+
+calls = Counter()  # method -> تعداد
+latency = 0.0      # تأخیر مصنوعی هر درخواست (ثانیه)
+_message_ids = itertools.count(1_000_000)
+
+app = FastAPI()
+
+
+def reset():
+    calls.clear()
+
+
+def _user(user_id: int, is_bot: bool = False) -> dict:
+    return {"id": user_id, "is_bot": is_bot, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+
+
+def _chat(chat_id) -> dict:
+    return {"id": int(chat_id), "type": "supergroup", "title": f"group{chat_id}"}
+
+
+async def _params(request: Request) -> dict:
+    # python-telegram-bot پارامترها را به شکل فرم و مقادیر پیچیده را به شکل JSON می‌فرستد
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return await request.json()
+    params = {}
+    for key, value in parse_qsl((await request.body()).decode()):
+        try:
+            params[key] = json.loads(value)
+        except (TypeError, ValueError):
+            params[key] = value
+    return params
+
+
+def _result(method: str, params: dict):
+    if method == "getMe":
+        return {**_user(BOT_ID, is_bot=True), "can_join_groups": True,
+                "can_read_all_group_messages": True, "supports_inline_queries": False}
+    if method == "getWebhookInfo":
+        return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+    if method == "getChatAdministrators":
+        return [
+            {"status": "creator", "user": _user(OWNER_ID), "is_anonymous": False},
+            {"status": "administrator", "user": _user(BOT_ID, is_bot=True), "can_be_edited": False,
+             "is_anonymous": False, "can_manage_chat": True, "can_delete_messages": True,
+             "can_manage_video_chats": True, "can_restrict_members": True, "can_promote_members": False,
+             "can_change_info": True, "can_invite_users": True}
+        ]
+    if method == "getChatMember":
+        return {"status": "member", "user": _user(int(params.get("user_id", 0)))}
+    if method == "getChat":
+        return _chat(params.get("chat_id", 0))
+    if method in ("sendMessage", "editMessageText"):
+        return {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": _chat(params.get("chat_id", 0)),
+            "from": _user(BOT_ID, is_bot=True),
+            "text": params.get("text", "")
+        }
+    return True
+
+
+@app.post("/bot{token}/{method}")
+async def bot_method(token: str, method: str, request: Request):
+    calls[method] += 1
+    if latency:
+        await asyncio.sleep(latency)
+    return {"ok": True, "result": _result(method, await _params(request))}
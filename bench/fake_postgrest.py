@@ -0,0 +1,264 @@
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# شبیه‌ساز درون‌حافظه‌ای بخشی از PostgREST که database.py استفاده می‌کند:
+# فیلترهای col=op.value، and/or تو در تو، select، order، limit، Prefer و rpc/change_warning
+
+tables = {"groups": [], "subscriptions": [], "warnings": [], "group_rules": [], "audit_log": [], "group_activity_hourly": []}
+# ایندکس group_id برای جستجوهای eq تا هر درخواست کل جدول را پیمایش نکند
+_index = {table: {} for table in tables}
+calls = Counter()  # (method, table) -> تعداد
+latency = 0.0      # تأخیر مصنوعی هر درخواست (ثانیه)
+_ids = itertools.count(1)
+_warning_requests = set()  # p_request_id های اعمال‌شده (جدول warning_requests)
+_activity_requests = set()  # همین برای group_activity_requests
+
+app = FastAPI()
+
+
+def reset():
+    for rows in tables.values():
+        rows.clear()
+    for index in _index.values():
+        index.clear()
+    calls.clear()
+    _warning_requests.clear()
+    _activity_requests.clear()
+
+
+def add_row(table: str, row: dict):
+    tables[table].append(row)
+    _index[table].setdefault(row.get("group_id"), []).append(row)
+
+
+def _candidates(table: str, filters):
+    for key, value in filters:
+        if key == "group_id" and value.startswith("eq."):
+            return _index[table].get(int(value[3:]), [])
+    return tables[table]
+
+
+def _split(text: str):
+    # جدا کردن با کاما در عمق صفر، بدون شکستن مقادیر داخل کوتیشن
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _to_datetime(value: str):
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _coerce(current, value: str):
+    value = value.strip('"')
+    if isinstance(current, bool):
+        return current, value == "true"
+    if isinstance(current, (int, float)):
+        return current, float(value)
+    if isinstance(current, str):
+        left, right = _to_datetime(current), _to_datetime(value)
+        if left and right:
+            return left, right
+    return current, value
+
+
+def _compare(row: dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, value = expression.partition(".")
+    current = row.get(column)
+
+    if op == "is":
+        result = current is None if value == "null" else current == (value == "true")
+    elif op == "in":
+        result = current is not None and any(
+            left == right for left, right in (_coerce(current, item) for item in _split(value[1:-1]))
+        )
+    elif current is None:
+        result = False  # مثل SQL: مقایسه با null نتیجه ندارد
+    else:
+        left, right = _coerce(current, value)
+        result = {
+            "eq": left == right, "neq": left != right,
+            "gt": left > right, "gte": left >= right,
+            "lt": left < right, "lte": left <= right
+        }[op]
+    return not result if negate else result
+
+
+def _logic(row: dict, op: str, body: str) -> bool:
+    results = (_condition(row, part) for part in _split(body[1:-1]))
+    return any(results) if op == "or" else all(results)
+
+
+def _condition(row: dict, condition: str) -> bool:
+    for op in ("or", "and"):
+        if condition.startswith(op + "("):
+            return _logic(row, op, condition[len(op):])
+    column, _, expression = condition.partition(".")
+    return _compare(row, column, expression)
+
+
+def _matches(row: dict, filters) -> bool:
+    for key, value in filters:
+        if key in ("or", "and"):
+            if not _logic(row, key, value):
+                return False
+        elif not _compare(row, key, value):
+            return False
+    return True
+
+
+def _query(request: Request):
+    filters, select, order, limit = [], None, None, None
+    for key, value in request.query_params.multi_items():
+        if key == "select":
+            select = value.split(",")
+        elif key == "order":
+            order = value
+        elif key == "limit":
+            limit = int(value)
+        else:
+            filters.append((key, value))
+    return filters, select, order, limit
+
+
+def _project(rows, select):
+    if not select or select == ["*"]:
+        return [dict(row) for row in rows]
+    return [{column: row.get(column) for column in select} for row in rows]
+
+
+def _wants_rows(request: Request) -> bool:
+    return "return=representation" in request.headers.get("prefer", "")
+
+
+async def _delay():
+    if latency:
+        await asyncio.sleep(latency)
+
+
+@app.get("/rest/v1/{table}")
+async def select_rows(table: str, request: Request):
+    calls[("GET", table)] += 1
+    await _delay()
+    filters, select, order, limit = _query(request)
+    rows = [row for row in _candidates(table, filters) if _matches(row, filters)]
+    if order:
+        column, _, direction = order.partition(".")
+        rows.sort(key=lambda row: row.get(column), reverse=direction == "desc")
+    if limit is not None:
+        rows = rows[:limit]
+    return _project(rows, select)
+
+
+@app.post("/rest/v1/rpc/change_warning")
+async def change_warning(request: Request):
+    calls[("POST", "rpc/change_warning")] += 1
+    await _delay()
+    data = await request.json()
+    key = (data["p_group_id"], data["p_user_id"])
+    row = next((row for row in _index["warnings"].get(key[0], []) if row["user_id"] == key[1]), None)
+
+    request_id = data.get("p_request_id")
+    if request_id is not None:
+        if request_id in _warning_requests:
+            return row["count"] if row else 0
+        _warning_requests.add(request_id)
+
+    if data["p_delta"] >= 0:
+        if row is None:
+            row = {"group_id": key[0], "user_id": key[1], "username": data["p_username"], "count": 0}
+            add_row("warnings", row)
+        row["count"] += data["p_delta"]
+    elif row is not None:
+        row["count"] = max(row["count"] + data["p_delta"], 0)
+    return row["count"] if row else 0
+
+
+@app.post("/rest/v1/rpc/merge_group_activity")
+async def merge_group_activity(request: Request):
+    calls[("POST", "rpc/merge_group_activity")] += 1
+    await _delay()
+    body = await request.json()
+    request_id = body.get("p_request_id")
+    if request_id is not None:
+        if request_id in _activity_requests:
+            return Response(status_code=204)
+        _activity_requests.add(request_id)
+    for data in body["p_rows"]:
+        row = next((row for row in _index["group_activity_hourly"].get(data["group_id"], [])
+                    if row["hour"] == data["hour"]), None)
+        if row is None:
+            add_row("group_activity_hourly", dict(data))
+            continue
+        row["messages"] += data["messages"]
+        row["users"] = {key: max(row["users"].get(key, 0), rank) for key, rank in {**row["users"], **data["users"]}.items()}
+        for key, count in data["top"].items():
+            row["top"][key] = row["top"].get(key, 0) + count
+    return Response(status_code=204)
+
+
+@app.post("/rest/v1/{table}")
+async def insert_rows(table: str, request: Request):
+    calls[("POST", table)] += 1
+    await _delay()
+    data = await request.json()
+    rows = data if isinstance(data, list) else [data]
+    for row in rows:
+        row.setdefault("id", next(_ids))
+        add_row(table, row)
+    if _wants_rows(request):
+        return JSONResponse(_project(rows, _query(request)[1]), status_code=201)
+    return Response(status_code=201)
+
+
+@app.patch("/rest/v1/{table}")
+async def update_rows(table: str, request: Request):
+    calls[("PATCH", table)] += 1
+    await _delay()
+    data = await request.json()
+    filters, select, _, _ = _query(request)
+    rows = [row for row in _candidates(table, filters) if _matches(row, filters)]
+    for row in rows:
+        row.update(data)
+    if _wants_rows(request):
+        return _project(rows, select)
+    return Response(status_code=204)
+
+
+@app.delete("/rest/v1/{table}")
+async def delete_rows(table: str, request: Request):
+    calls[("DELETE", table)] += 1
+    await _delay()
+    filters, select, _, _ = _query(request)
+    deleted = [row for row in _candidates(table, filters) if _matches(row, filters)]
+    for row in deleted:
+        tables[table].remove(row)
+        _index[table][row.get("group_id")].remove(row)
+    if _wants_rows(request):
+        return _project(deleted, select)
+    return Response(status_code=204)
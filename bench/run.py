@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import os
+import random
+import socket
+import time
+
+import httpx
+import uvicorn
+
+from bench import fake_botapi, fake_postgrest
+
+# بنچمارک کامل بدون Supabase و تلگرام واقعی:
+#   python -m bench.run link_spam --groups 50 --messages 5000
+#   python -m bench.run night_sweep --groups 10000
+# فیک‌ها روی localhost اجرا می‌شوند و main از طریق متغیرهای محیطی به آن‌ها وصل می‌شود
+
+TOKEN = "123456:BENCH"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _serve(app, port: int):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+def configure(args, postgrest_port: int, botapi_port: int):
+    # باید قبل از import main انجام شود؛ config مقادیر را هنگام import می‌خواند
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "SUPABASE_URL": f"http://127.0.0.1:{postgrest_port}",
+        "SUPABASE_API_KEY": "bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{botapi_port}/bot",
+        "RENDER_EXTERNAL_HOSTNAME": "bench.local",
+    })
+    if not args.real_limits:
+        # فقط سربار خود ربات اندازه‌گیری شود، نه محدودیت‌های عمدی Bot API
+        os.environ.setdefault("FANOUT_RATE", "1000000")
+        os.environ.setdefault("FANOUT_CHAT_INTERVAL", "0")
+
+
+def seed_groups(count: int, night_lock: bool):
+    for i in range(count):
+        fake_postgrest.add_row("groups", {
+            "group_id": -1000000000000 - i,
+            "title": f"group{i}",
+            "is_locked": False,
+            "lock_until": None,
+            "night_lock_active": night_lock,
+            "night_lock_disabled_until": None,
+            "last_night_lock_applied": None,
+            "last_night_lock_released": None,
+            "timezone": "Asia/Tehran",
+            "night_lock_start": "02:00",
+            "night_lock_end": "07:00",
+            "allowed_domains": ["example.com"],
+            "welcome_window": None,
+            "welcome_batch": None,
+            "flood_limit": None,
+            "flood_window": None,
+        })
+
+
+def text_message(update_id: int, chat_id: int, user_id: int, text: str, entities=None) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "supergroup", "title": f"group{chat_id}"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+        "text": text,
+    }
+    if entities:
+        message["entities"] = entities
+    return {"update_id": update_id, "message": message}
+
+
+def link_spam_updates(groups: int, users: int, count: int):
+    # ترکیب پیام‌های عادی، لینک مجاز، لینک غیرمجاز و لینک مخفی‌شده
+    samples = [
+        ("سلام", None),
+        ("کسی می‌دونه جلسه کی شروعه؟", None),
+        ("https://example.com/docs", [{"type": "url", "offset": 0, "length": 24}]),
+        ("join https://spam.example.org/free now", [{"type": "url", "offset": 5, "length": 28}]),
+        ("t . me/spamchannel", None),
+        ("free coins at spam[.]io", None),
+    ]
+    random.seed(1)
+    for update_id in range(1, count + 1):
+        text, entities = random.choice(samples)
+        chat_id = -1000000000000 - random.randrange(groups)
+        yield text_message(update_id, chat_id, 10_000 + random.randrange(users), text, entities)
+
+
+class Replay:
+    # زمان از ارسال به webhook تا پایان process_update هر آپدیت
+    def __init__(self, main):
+        self.main = main
+        self.sent_at = {}
+        self.latencies = []
+        self.busy = 0
+        self.done = asyncio.Event()
+        self.expected = 0
+        self.application = main.update_queue.application
+        # UpdateQueue فقط process_update را صدا می‌زند؛ یک لایه زمان‌سنج جای آن قرار می‌گیرد
+        main.update_queue.application = self
+
+    async def process_update(self, update):
+        try:
+            await self.application.process_update(update)
+        finally:
+            self.latencies.append(time.perf_counter() - self.sent_at.pop(update.update_id))
+            if len(self.latencies) == self.expected:
+                self.done.set()
+
+    async def run(self, updates, connections: int):
+        updates = list(updates)
+        self.expected = len(updates)
+        semaphore = asyncio.Semaphore(connections)
+        transport = httpx.ASGITransport(app=self.main.app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def post(data):
+                async with semaphore:
+                    while True:
+                        self.sent_at[data["update_id"]] = time.perf_counter()
+                        response = await client.post(self.main.WEBHOOK_PATH, json=data)
+                        if response.status_code != 503:
+                            return
+                        # مثل تلگرام، بعد از کمی صبر دوباره ارسال می‌شود
+                        self.busy += 1
+                        await asyncio.sleep(0.05)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(data) for data in updates))
+            await asyncio.wait_for(self.done.wait(), timeout=300)
+            return time.perf_counter() - started
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def report_calls():
+    print("  Bot API:")
+    for method, count in sorted(fake_botapi.calls.items()):
+        print(f"    {method:<28}{count:>8}")
+    print("  PostgREST:")
+    for (method, table), count in sorted(fake_postgrest.calls.items()):
+        print(f"    {method + ' ' + table:<28}{count:>8}")
+
+
+async def link_spam(main, args):
+    seed_groups(args.groups, night_lock=False)
+    await main.startup()
+    await main.warmup_task
+    fake_botapi.reset()
+    fake_postgrest.calls.clear()
+
+    replay = Replay(main)
+    elapsed = await replay.run(link_spam_updates(args.groups, args.users, args.messages), args.connections)
+
+    print(f"link_spam: {args.messages} پیام، {args.groups} گروه، {args.users} کاربر")
+    print(f"  {args.messages / elapsed:,.0f} آپدیت در ثانیه ({elapsed:.2f} ثانیه)")
+    print(f"  p50 {percentile(replay.latencies, 0.50) * 1000:.2f} ms، p99 {percentile(replay.latencies, 0.99) * 1000:.2f} ms")
+    print(f"  503 (صف پر): {replay.busy}")
+    report_calls()
+
+
+async def night_sweep(main, args):
+    seed_groups(args.groups, night_lock=True)
+    started = time.perf_counter()
+    await main.startup()
+    print(f"night_sweep: {args.groups} گروه")
+    print(f"  startup: {time.perf_counter() - started:.2f} ثانیه")
+    await main.warmup_task
+    print(f"  startup + warm-up (load_schedule): {time.perf_counter() - started:.2f} ثانیه")
+
+    bot = main.application.bot
+    for name, sweep in (
+        ("warn", main.check_and_warn_night_lock),
+        ("apply", main.check_and_apply_night_lock),
+        ("release", main.check_and_release_night_lock),
+    ):
+        fake_botapi.reset()
+        fake_postgrest.calls.clear()
+        started = time.perf_counter()
+        await sweep(bot)
+        elapsed = time.perf_counter() - started
+        print(f"  {name}: {elapsed:.2f} ثانیه، {args.groups / elapsed:,.0f} گروه در ثانیه")
+        report_calls()
+
+
+SCENARIOS = {"link_spam": link_spam, "night_sweep": night_sweep}
+
+
+async def main_async(args):
+    fake_postgrest.latency = fake_botapi.latency = args.latency / 1000
+    postgrest_port, botapi_port = _free_port(), _free_port()
+    servers = [
+        await _serve(fake_postgrest.app, postgrest_port),
+        await _serve(fake_botapi.app, botapi_port),
+    ]
+    configure(args, postgrest_port, botapi_port)
+    import main
+
+    try:
+        await SCENARIOS[args.scenario](main, args)
+    finally:
+        # اگر startup شکست خورده باشد چیزی برای بستن نیست
+        if main.application and main.application.running:
+            await main.shutdown()
+        for server, task in servers:
+            server.should_exit = True
+            await task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="بنچمارک ربات با Supabase و Bot API شبیه‌سازی‌شده")
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--groups", type=int, default=None, help="تعداد گروه‌ها (پیش‌فرض: 50 برای link_spam، 10000 برای night_sweep)")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=40, help="حداکثر درخواست همزمان به وبهوک (مثل max_connections تلگرام)")
+    parser.add_argument("--latency", type=float, default=0, help="تأخیر مصنوعی هر درخواست بیرونی به میلی‌ثانیه")
+    parser.add_argument("--real-limits", action="store_true", help="محدودیت‌های FANOUT_* را تغییر نده")
+    args = parser.parse_args()
+    if args.groups is None:
+        args.groups = 10000 if args.scenario == "night_sweep" else 50
+    asyncio.run(main_async(args))
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+# کش ساده با محدودیت اندازه (LRU) و زمان انقضا
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            # مقدار منقضی تا زمان حذف LRU برای get_stale نگه داشته می‌شود
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key, default=None):
+        # آخرین مقدار، حتی اگر منقضی شده باشد (برای زمانی که منبع اصلی در دسترس نیست)
+        item = self._data.get(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        if item is _MISSING:
+            return default
+        return item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
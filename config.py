@@ -3,3 +3,90 @@ import os
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY")
+# آدرس Bot API (برای سرور محلی Bot API یا بنچمارک)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+
+# تنظیمات اتصال به Supabase
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_KEEPALIVE = int(os.getenv("SUPABASE_KEEPALIVE", "10"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "5"))  # هر تلاش
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "3"))
+SUPABASE_CALL_DEADLINE = float(os.getenv("SUPABASE_CALL_DEADLINE", "8"))  # کل فراخوانی با تلاش‌های دوباره
+SUPABASE_RETRIES = int(os.getenv("SUPABASE_RETRIES", "2"))
+SUPABASE_RETRY_BUDGET = float(os.getenv("SUPABASE_RETRY_BUDGET", "0.1"))  # تلاش دوباره به ازای هر درخواست
+SUPABASE_BREAKER_FAILURES = int(os.getenv("SUPABASE_BREAKER_FAILURES", "5"))
+SUPABASE_BREAKER_RESET = float(os.getenv("SUPABASE_BREAKER_RESET", "30"))
+
+# کش ادمین‌های هر گروه
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "300"))
+ADMIN_CACHE_SIZE = int(os.getenv("ADMIN_CACHE_SIZE", "10000"))
+
+# کش لیست دامنه‌های مجاز هر گروه
+ALLOWLIST_CACHE_TTL = int(os.getenv("ALLOWLIST_CACHE_TTL", "600"))
+ALLOWLIST_CACHE_SIZE = int(os.getenv("ALLOWLIST_CACHE_SIZE", "10000"))
+
+# صف پردازش آپدیت‌های وبهوک
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_DEDUP_SIZE = int(os.getenv("UPDATE_DEDUP_SIZE", "10000"))  # تعداد update_id اخیر برای حذف ارسال‌های تکراری
+
+# تعداد ردیف در هر صفحه از بررسی‌های دوره‌ای
+SWEEP_PAGE_SIZE = int(os.getenv("SWEEP_PAGE_SIZE", "500"))
+
+# تلاش دوباره برای بارگذاری زمان‌بندی در شروع برنامه (ثانیه؛ هر بار دو برابر تا سقف)
+SCHEDULE_RETRY_DELAY = float(os.getenv("SCHEDULE_RETRY_DELAY", "5"))
+SCHEDULE_RETRY_MAX_DELAY = float(os.getenv("SCHEDULE_RETRY_MAX_DELAY", "300"))
+
+# ارسال همزمان به گروه‌ها در بررسی‌های دوره‌ای (محدودیت‌های Bot API)
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "20"))
+FANOUT_RATE = float(os.getenv("FANOUT_RATE", "25"))  # درخواست در ثانیه برای کل ربات
+FANOUT_CHAT_INTERVAL = float(os.getenv("FANOUT_CHAT_INTERVAL", "1"))  # فاصله بین درخواست‌ها به یک چت
+FANOUT_MAX_RETRIES = int(os.getenv("FANOUT_MAX_RETRIES", "3"))
+
+# کش ردیف‌های groups و subscriptions
+GROUP_CACHE_TTL = int(os.getenv("GROUP_CACHE_TTL", "60"))
+GROUP_CACHE_SIZE = int(os.getenv("GROUP_CACHE_SIZE", "50000"))
+
+# تجمیع پیام‌های خوش‌آمد (پیش‌فرض؛ هر گروه می‌تواند مقدار خودش را داشته باشد)
+WELCOME_WINDOW = float(os.getenv("WELCOME_WINDOW", "5"))
+WELCOME_MAX_BATCH = int(os.getenv("WELCOME_MAX_BATCH", "20"))
+
+# ضد اسپم: حداکثر پیام در بازه (پیش‌فرض؛ هر گروه می‌تواند مقدار خودش را داشته باشد)
+FLOOD_LIMIT = int(os.getenv("FLOOD_LIMIT", "5"))
+FLOOD_WINDOW = float(os.getenv("FLOOD_WINDOW", "5"))
+FLOOD_MUTE_SECONDS = int(os.getenv("FLOOD_MUTE_SECONDS", "300"))
+FLOOD_MAX_ENTRIES = int(os.getenv("FLOOD_MAX_ENTRIES", "200000"))
+FLOOD_IDLE_TTL = float(os.getenv("FLOOD_IDLE_TTL", "120"))
+
+# کش قوانین کامپایل‌شده هر گروه
+RULE_CACHE_TTL = int(os.getenv("RULE_CACHE_TTL", "3600"))
+RULE_CACHE_SIZE = int(os.getenv("RULE_CACHE_SIZE", "10000"))
+
+# نسخه محلی SQLite از groups، subscriptions و warnings (خالی = غیرفعال)
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", "")
+REPLICATION_INTERVAL = float(os.getenv("REPLICATION_INTERVAL", "5"))
+REPLICATION_BATCH = int(os.getenv("REPLICATION_BATCH", "100"))
+
+# آخرین پیام‌های هر چت برای /purge و حذف پیام‌های کاربر بن‌شده
+RECENT_MESSAGES = int(os.getenv("RECENT_MESSAGES", "500"))
+RECENT_CHATS = int(os.getenv("RECENT_CHATS", "2000"))
+
+# متن‌های تکراری بین گروه‌ها (اسپم سراسری)
+SPAM_GROUP_THRESHOLD = int(os.getenv("SPAM_GROUP_THRESHOLD", "3"))  # از این تعداد گروه به بعد حذف می‌شود
+SPAM_TTL = float(os.getenv("SPAM_TTL", "600"))
+SPAM_MAX_ENTRIES = int(os.getenv("SPAM_MAX_ENTRIES", "10000"))  # حدود ۱.۵ کیلوبایت برای هر متن
+SPAM_MIN_LENGTH = int(os.getenv("SPAM_MIN_LENGTH", "30"))
+SPAM_SIMILARITY = float(os.getenv("SPAM_SIMILARITY", "0.6"))  # سهم هش‌های مشترک برای یکسان دانستن دو نسخه
+
+# یوزرنیم و نام کاربران دیده‌شده در هر گروه برای /warn @user و مانند آن
+MEMBER_INDEX_SIZE = int(os.getenv("MEMBER_INDEX_SIZE", "50000"))
+
+# گزارش اقدامات مدیریتی؛ رویدادها دسته‌ای در Supabase نوشته می‌شوند
+AUDIT_BATCH = int(os.getenv("AUDIT_BATCH", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "10"))
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "20000"))  # سقف رویدادهای ارسال‌نشده هنگام قطعی
+AUDIT_EXPORT_TOKEN = os.getenv("AUDIT_EXPORT_TOKEN", "")  # خالی = خروجی /audit غیرفعال
+
+# آمار فعالیت گروه‌ها (/stats)؛ شمارش در حافظه و ارسال دوره‌ای به جدول rollup
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "300"))
+STATS_TOP_CAPACITY = int(os.getenv("STATS_TOP_CAPACITY", "32"))  # کاربران شمرده‌شده برای پرکارترین‌ها در هر ساعت
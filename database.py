@@ -1,6 +1,15 @@
-import requests
-from datetime import datetime, date, timedelta
-from config import SUPABASE_URL, SUPABASE_API_KEY
+import asyncio
+import httpx
+from datetime import datetime, date, timedelta, timezone
+from cache import TTLCache
+from resilience import ResilientTransport, CircuitOpenError
+from scheduler import parse_utc
+from local_store import store, PATCH_GROUP, INSERT_GROUP, INSERT_SUBSCRIPTION
+from config import (
+    SUPABASE_URL, SUPABASE_API_KEY, SUPABASE_POOL_SIZE, SUPABASE_KEEPALIVE,
+    SUPABASE_TIMEOUT, SUPABASE_CONNECT_TIMEOUT, SWEEP_PAGE_SIZE,
+    GROUP_CACHE_TTL, GROUP_CACHE_SIZE, REPLICATION_INTERVAL, REPLICATION_BATCH
+)
 
 headers = {
     "apikey": SUPABASE_API_KEY,
@@ -8,26 +17,126 @@ headers = {
     "Content-Type": "application/json"
 }
 
-def add_group(group_id, title):
-    url = f"{SUPABASE_URL}/rest/v1/groups"
-    check_url = f"{url}?group_id=eq.{group_id}"
-    res = requests.get(check_url, headers=headers)
+# کلاینت مشترک با اتصال‌های keep-alive برای همه هندلرها و بررسی‌های دوره‌ای
+_client: httpx.AsyncClient = None
 
-    if res.status_code == 200 and res.json():
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/rest/v1",
+            headers=headers,
+            # تلاش دوباره، مدار هر جدول و ثبت متریک هر تلاش (resilience.py و metrics.py)
+            transport=ResilientTransport(limits=httpx.Limits(
+                max_connections=SUPABASE_POOL_SIZE,
+                max_keepalive_connections=SUPABASE_KEEPALIVE
+            )),
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT)
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+async def _request(method: str, url: str, **kwargs):
+    # خطای شبکه، timeout یا مدار باز به None تبدیل می‌شود تا هر تابع مقدار جایگزین خودش را برگرداند
+    try:
+        return await get_client().request(method, url, **kwargs)
+    except CircuitOpenError:
+        return None
+    except httpx.HTTPError as e:
+        print(f"⚠️ درخواست {method} {url.split('?')[0]} به Supabase ناموفق بود: {type(e).__name__} {e}")
+        return None
+
+# کش write-through ردیف‌ها بر اساس group_id؛ {} یعنی ردیف وجود ندارد
+GROUP_COLUMNS = "group_id,title,is_locked,lock_until,night_lock_active,night_lock_disabled_until,timezone,night_lock_start,night_lock_end,allowed_domains,welcome_window,welcome_batch,flood_limit,flood_window"
+_groups = TTLCache(maxsize=GROUP_CACHE_SIZE, ttl=GROUP_CACHE_TTL)
+_subscriptions = TTLCache(maxsize=GROUP_CACHE_SIZE, ttl=GROUP_CACHE_TTL)
+RETURN_ROW = {"Prefer": "return=representation"}
+
+def cache_stats():
+    return {
+        name: {"hits": cache.hits, "misses": cache.misses, "size": len(cache)}
+        for name, cache in (("groups", _groups), ("subscriptions", _subscriptions))
+    }
+
+async def get_group(group_id: int):
+    row = _groups.get(group_id)
+    if row is None:
+        # کش حافظه، بعد نسخه محلی SQLite (اگر فعال باشد)، بعد Supabase
+        row = store.get_group(group_id) if store else None
+        if row is None:
+            response = await _request("GET", f"/groups?group_id=eq.{group_id}&select={GROUP_COLUMNS}")
+            if response is None or response.status_code != 200:
+                # در زمان قطعی آخرین مقدار کش‌شده، حتی منقضی، استفاده می‌شود
+                return _groups.get_stale(group_id) or None
+            rows = response.json()
+            row = rows[0] if rows else {}
+            if store and row:
+                store.put_group(row)
+        _groups.set(group_id, row)
+    return row or None
+
+async def _patch_group(group_id: int, data: dict):
+    if store:
+        # تغییر محلی ثبت و بعداً در پس‌زمینه به Supabase فرستاده می‌شود
+        current = await get_group(group_id)
+        if current is None:
+            return False
+        row = store.patch_group(group_id, data)
+        if row is None:
+            store.put_group(current)
+            row = store.patch_group(group_id, data)
+        _groups.set(group_id, row)
+        _replicate_now.set()
+        return True
+
+    # ردیف به‌روزشده در همان درخواست برگردانده و در کش ذخیره می‌شود
+    response = await _request(
+        "PATCH",
+        f"/groups?group_id=eq.{group_id}&select={GROUP_COLUMNS}",
+        headers=RETURN_ROW,
+        json=data
+    )
+    if response is None or response.status_code not in [200, 204]:
+        _groups.pop(group_id)
+        return False
+    rows = response.json() if response.status_code == 200 else []
+    if rows:
+        _groups.set(group_id, rows[0])
+    else:
+        _groups.pop(group_id)
+    return True
+
+async def add_group(group_id, title):
+    if await get_group(group_id):
         return False  # گروه قبلاً ثبت شده
 
     data = {
         "group_id": group_id,
         "title": title
     }
-    insert = requests.post(url, headers={**headers, "Content-Type": "application/json"}, json=data)
+    if store:
+        store.insert_group(data)
+        _groups.set(group_id, data)
+        _replicate_now.set()
+        return await add_subscription(group_id)
+
+    insert = await _request("POST", f"/groups?select={GROUP_COLUMNS}", headers=RETURN_ROW, json=data)
 
-    if insert.status_code in [200, 201]:
-        return add_subscription(group_id)
+    if insert is not None and insert.status_code in [200, 201]:
+        rows = insert.json()
+        if rows:
+            _groups.set(group_id, rows[0])
+        else:
+            _groups.pop(group_id)
+        return await add_subscription(group_id)
     return False
 
-def add_subscription(group_id):
-    url = f"{SUPABASE_URL}/rest/v1/subscriptions"
+async def add_subscription(group_id):
     today = date.today()
     end = today + timedelta(days=30)
 
@@ -36,129 +145,422 @@ def add_subscription(group_id):
         "start_date": today.isoformat(),
         "end_date": end.isoformat()
     }
+    if store:
+        store.insert_subscription(data)
+        _subscriptions.set(group_id, {"end_date": data["end_date"]})
+        _replicate_now.set()
+        return True
 
-    res = requests.post(url, headers={**headers, "Content-Type": "application/json"}, json=data)
-    return res.status_code in [200, 201]
+    res = await _request("POST", "/subscriptions", json=data)
+    if res is not None and res.status_code in [200, 201]:
+        _subscriptions.set(group_id, {"end_date": data["end_date"]})
+        return True
+    _subscriptions.pop(group_id)
+    return False
 
-def get_subscription_status(group_id):
-    url = f"{SUPABASE_URL}/rest/v1/subscriptions?group_id=eq.{group_id}&select=end_date"
-    res = requests.get(url, headers=headers)
-    data = res.json()
+async def get_subscription_status(group_id):
+    subscription = _subscriptions.get(group_id)
+    if subscription is None:
+        subscription = store.get_subscription(group_id) if store else None
+        if subscription is None:
+            res = await _request("GET", f"/subscriptions?group_id=eq.{group_id}&select=end_date")
+            if res is None or res.status_code != 200:
+                # بدنه خطا ممکن است JSON نباشد؛ آخرین مقدار کش‌شده یا None (نامعلوم)
+                subscription = _subscriptions.get_stale(group_id)
+                if subscription is None:
+                    return None
+            else:
+                data = res.json()
+                subscription = data[0] if data else {}
+                if store and subscription:
+                    store.put_subscription(group_id, subscription["end_date"])
+                _subscriptions.set(group_id, subscription)
+        else:
+            _subscriptions.set(group_id, subscription)
 
-    if not data:
+    if not subscription:
         return -1  # اشتراک یافت نشد
 
-    end_date = datetime.fromisoformat(data[0]['end_date']).date()
+    end_date = datetime.fromisoformat(subscription['end_date']).date()
     days_left = (end_date - date.today()).days
     return days_left
 
-def add_warning(group_id: int, user_id: int, username: str):
-    url = f"{SUPABASE_URL}/rest/v1/warnings"
+async def change_warning(group_id: int, user_id: int, delta: int, username: str = None):
+    if store:
+        if store.get_warning(group_id, user_id) is None:
+            # پایه شمارش از Supabase؛ اگر در دسترس نبود بعد از همگام‌سازی اصلاح می‌شود
+            count = await _remote_warning_count(group_id, user_id)
+            if count is not None:
+                store.put_warning(group_id, user_id, count, username)
+        count = store.change_warning(group_id, user_id, delta, username)
+        _replicate_now.set()
+        return count
 
-    # بررسی وجود اخطار قبلی
-    check_url = f"{url}?group_id=eq.{group_id}&user_id=eq.{user_id}"
-    response = requests.get(check_url, headers=headers)
-    data = response.json()
+    # تابع change_warning در migrations/002_warnings_atomic.sql (و 010 با کلید تکرار) تعریف شده است
+    data = {
+        "p_group_id": group_id,
+        "p_user_id": user_id,
+        "p_username": username,
+        "p_delta": delta
+    }
+    response = await _request("POST", "/rpc/change_warning", json=data)
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()
 
-    if data:
-        current_count = data[0]["count"] + 1
-        update_data = {
-            "count": current_count,
-            "last_warning": datetime.utcnow().isoformat()
-        }
-        requests.patch(check_url, headers=headers, json=update_data)
-        return current_count
-    else:
-        insert_data = [{
-            "group_id": group_id,
-            "user_id": user_id,
-            "username": username,
-            "count": 1,
-            "last_warning": datetime.utcnow().isoformat()
-        }]
-        requests.post(url, headers=headers, json=insert_data)
-        return 1
-
-def get_warning_count(group_id: int, user_id: int):
-    url = f"{SUPABASE_URL}/rest/v1/warnings?group_id=eq.{group_id}&user_id=eq.{user_id}"
-    response = requests.get(url, headers=headers)
+async def add_warning(group_id: int, user_id: int, username: str):
+    return await change_warning(group_id, user_id, 1, username)
+
+async def get_warning_count(group_id: int, user_id: int):
+    if store:
+        count = store.get_warning(group_id, user_id)
+        if count is not None:
+            return count
+    count = await _remote_warning_count(group_id, user_id)
+    if store and count is not None:
+        store.put_warning(group_id, user_id, count)
+    return count
+
+async def _remote_warning_count(group_id: int, user_id: int):
+    response = await _request("GET", f"/warnings?group_id=eq.{group_id}&user_id=eq.{user_id}&select=count")
+    if response is None or response.status_code != 200:
+        return None
     data = response.json()
     return data[0]["count"] if data else 0
 
-def remove_warning(group_id: int, user_id: int, count_to_remove: int = 1):
-    url = f"{SUPABASE_URL}/rest/v1/warnings?group_id=eq.{group_id}&user_id=eq.{user_id}"
-    response = requests.get(url, headers=headers)
-    data = response.json()
-    if data:
-        current = data[0]["count"]
-        new_count = max(0, current - count_to_remove)
-        update_data = {
-            "count": new_count,
-            "last_warning": datetime.utcnow().isoformat()
-        }
-        requests.patch(url, headers=headers, json=update_data)
-        return new_count
-    return 0
-
-from datetime import datetime, timezone
-import requests
-
-def get_night_lock_status(group_id: int):
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{group_id}&select=night_lock_active,night_lock_disabled_until,is_locked"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200 or not response.json():
+async def remove_warning(group_id: int, user_id: int, count_to_remove: int = 1):
+    return await change_warning(group_id, user_id, -count_to_remove)
+
+async def iter_groups(select: str, filters: dict = None, page_size: int = SWEEP_PAGE_SIZE, group_ids: list = None):
+    # فیلترها سمت PostgREST اعمال می‌شوند و نتایج صفحه به صفحه (بر اساس group_id) خوانده می‌شوند
+    if group_ids is None:
+        async for row in _iter_group_pages(select, filters, page_size, []):
+            yield row
+        return
+
+    # محدود کردن به گروه‌های مشخص، در دسته‌های کوچک تا آدرس درخواست طولانی نشود
+    group_ids = sorted(set(group_ids))
+    for i in range(0, len(group_ids), 100):
+        ids = ",".join(str(group_id) for group_id in group_ids[i:i + 100])
+        async for row in _iter_group_pages(select, filters, page_size, [("group_id", f"in.({ids})")]):
+            yield row
+
+async def _iter_group_pages(select: str, filters: dict, page_size: int, extra: list):
+    last_id = None
+    while True:
+        rows = await _get_group_page(select, filters, page_size, extra, last_id)
+        if rows is None:
+            return
+
+        for row in rows:
+            yield row
+
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["group_id"]
+
+async def _get_group_page(select: str, filters: dict, page_size: int, extra: list, last_id: int = None):
+    params = [("select", select), ("order", "group_id.asc"), ("limit", page_size), *(filters or {}).items(), *extra]
+    if last_id is not None:
+        params.append(("group_id", f"gt.{last_id}"))
+
+    response = await _request("GET", "/groups", params=params)
+    if response is None or response.status_code != 200:
+        print(f"❌ خطا در واکشی گروه‌ها: {response.status_code if response is not None else 'no response'}")
         return None
-    return response.json()[0]
+    return response.json()
 
-def update_night_lock(group_id: int, active: bool = None, disabled_until: str = None):
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{group_id}"
+async def get_all_groups(select: str, filters: dict = None, page_size: int = SWEEP_PAGE_SIZE):
+    # همه صفحه‌ها یا هیچ؛ None یعنی یکی از صفحه‌ها خوانده نشد و نتیجه ناقص است
+    groups = []
+    last_id = None
+    while True:
+        rows = await _get_group_page(select, filters, page_size, [], last_id)
+        if rows is None:
+            return None
+        groups.extend(rows)
+        if len(rows) < page_size:
+            return groups
+        last_id = rows[-1]["group_id"]
+
+async def get_night_lock_status(group_id: int):
+    return await get_group(group_id)
+
+async def update_night_lock(group_id: int, active: bool = None, disabled_until: str = None,
+                            start: str = None, end: str = None, timezone_name: str = None):
     data = {}
     if active is not None:
         data["night_lock_active"] = active
     if disabled_until is not None:
         data["night_lock_disabled_until"] = disabled_until
+    if start is not None:
+        data["night_lock_start"] = start
+    if end is not None:
+        data["night_lock_end"] = end
+    if timezone_name is not None:
+        data["timezone"] = timezone_name
     if not data:
         return False
-    response = requests.patch(url, headers=headers, json=data)
-    return response.status_code in [200, 204]
+    return await _patch_group(group_id, data)
 
-def update_last_night_lock_applied(group_id: int):
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{group_id}"
+async def update_last_night_lock_applied(group_id: int):
     now = datetime.utcnow().isoformat()
     data = {"last_night_lock_applied": now}
-    response = requests.patch(url, headers=headers, json=data)
-    return response.status_code in [200, 204]
+    return await _patch_group(group_id, data)
 
-def update_last_night_lock_released(group_id: int):
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{group_id}"
+async def update_last_night_lock_released(group_id: int):
     now = datetime.utcnow().isoformat()
     data = {"last_night_lock_released": now}
-    response = requests.patch(url, headers=headers, json=data)
-    return response.status_code in [200, 204]
+    return await _patch_group(group_id, data)
 
-def update_lock_status(group_id: int, is_locked: bool, lock_until: str = None):
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{group_id}"
+async def update_lock_status(group_id: int, is_locked: bool, lock_until: str = None):
     data = {
         "is_locked": is_locked,
         "lock_until": lock_until
     }
-    response = requests.patch(url, headers=headers, json=data)
-    return response.status_code in [200, 204]
+    return await _patch_group(group_id, data)
 
-def is_group_locked(group_id: int):
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{group_id}&select=is_locked,lock_until"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200 or not response.json():
+async def is_group_locked(group_id: int):
+    data = await get_group(group_id)
+    if not data:
         return False
-    data = response.json()[0]
     is_locked = data.get("is_locked", False)
     lock_until = data.get("lock_until")
     if is_locked:
         if lock_until:
             lock_until_dt = datetime.fromisoformat(lock_until)
-            if datetime.utcnow() > lock_until_dt:
-                update_lock_status(group_id, False, None)
+            if lock_until_dt.tzinfo is None:
+                lock_until_dt = lock_until_dt.replace(tzinfo=timezone.utc)
+            if datetime.now(timezone.utc) > lock_until_dt:
+                await update_lock_status(group_id, False, None)
                 return False
         return True
     return False
 
+async def get_allowed_domains(group_id: int):
+    group = await get_group(group_id)
+    if not group:
+        return []
+    return group.get("allowed_domains") or []
+
+async def update_allowed_domains(group_id: int, domains: list):
+    data = {"allowed_domains": domains}
+    return await _patch_group(group_id, data)
+
+async def update_night_lock_state(group_id: int, is_locked: bool):
+    # وضعیت قفل و زمان اعمال/آزادسازی قفل شبانه در یک درخواست
+    now = datetime.utcnow().isoformat()
+    data = {
+        "is_locked": is_locked,
+        "lock_until": None,
+        "last_night_lock_applied" if is_locked else "last_night_lock_released": now
+    }
+    return await _patch_group(group_id, data)
+
+async def is_night_locked(group_id: int):
+    # قفل فعلی گروه از قفل شبانه است (نه قفل دستی)؛ ستون‌های زمان اعمال/آزادسازی در کش گروه نیستند
+    response = await _request(
+        "GET", "/groups",
+        params={"group_id": f"eq.{group_id}", "select": "is_locked,lock_until,last_night_lock_applied,last_night_lock_released"}
+    )
+    if response is None or response.status_code != 200 or not response.json():
+        return False
+    row = response.json()[0]
+    applied = row.get("last_night_lock_applied")
+    released = row.get("last_night_lock_released")
+    if not row.get("is_locked") or row.get("lock_until") or not applied:
+        return False
+    return not released or parse_utc(applied) > parse_utc(released)
+
+async def update_welcome_settings(group_id: int, window: float, batch: int):
+    data = {"welcome_window": window, "welcome_batch": batch}
+    return await _patch_group(group_id, data)
+
+async def update_flood_settings(group_id: int, limit: int, window: float):
+    data = {"flood_limit": limit, "flood_window": window}
+    return await _patch_group(group_id, data)
+
+async def get_group_rules(group_id: int):
+    response = await _request("GET", f"/group_rules?group_id=eq.{group_id}&select=id,kind,pattern,response&order=id.asc")
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()
+
+async def add_group_rule(group_id: int, kind: str, pattern: str, response_text: str = None):
+    data = {
+        "group_id": group_id,
+        "kind": kind,
+        "pattern": pattern,
+        "response": response_text
+    }
+    response = await _request("POST", "/group_rules", json=data)
+    return response is not None and response.status_code in [200, 201]
+
+async def delete_group_rule(group_id: int, rule_id: int):
+    response = await _request(
+        "DELETE",
+        f"/group_rules?group_id=eq.{group_id}&id=eq.{rule_id}",
+        headers=RETURN_ROW
+    )
+    return response is not None and response.status_code == 200 and bool(response.json())
+
+# گزارش اقدامات مدیریتی؛ event_id تکراری (ارسال دوباره بعد از پاسخ گم‌شده) نادیده گرفته می‌شود
+async def insert_audit_events(rows: list):
+    response = await _request(
+        "POST",
+        "/audit_log?on_conflict=event_id",
+        json=rows,
+        headers={"Prefer": "resolution=ignore-duplicates,return=minimal"}
+    )
+    return response is not None and response.status_code in [200, 201]
+
+async def iter_audit_events(group_id: int, after: int = 0, limit: int = None, page_size: int = SWEEP_PAGE_SIZE):
+    # صفحه به صفحه بر اساس id؛ id آخرین ردیف cursor صفحه بعد است
+    while limit is None or limit > 0:
+        size = page_size if limit is None else min(page_size, limit)
+        response = await _request("GET", "/audit_log", params=[
+            ("select", "id,group_id,action,actor_id,target_id,details,created_at"),
+            ("group_id", f"eq.{group_id}"),
+            ("id", f"gt.{after}"),
+            ("order", "id.asc"),
+            ("limit", size)
+        ])
+        if response is None or response.status_code != 200:
+            print(f"❌ خطا در خواندن گزارش اقدامات گروه {group_id}: {response.status_code if response is not None else 'no response'}")
+            return
+
+        rows = response.json()
+        for row in rows:
+            yield row
+
+        if len(rows) < size:
+            return
+        after = rows[-1]["id"]
+        if limit is not None:
+            limit -= len(rows)
+
+# آمار ساعتی گروه‌ها؛ تغییرها سمت دیتابیس با ردیف موجود همان ساعت جمع می‌شوند
+async def merge_group_activity(rows: list, request_id: str):
+    # تکرار یک request_id در Supabase نادیده گرفته می‌شود (migrations/011)
+    response = await _request("POST", "/rpc/merge_group_activity", json={"p_rows": rows, "p_request_id": request_id})
+    return response is not None and response.status_code in [200, 204]
+
+async def get_group_activity(group_id: int, since: str):
+    response = await _request("GET", "/group_activity_hourly", params=[
+        ("select", "hour,messages,users,top"),
+        ("group_id", f"eq.{group_id}"),
+        ("hour", f"gte.{since}"),
+        ("order", "hour.asc")
+    ])
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()
+
+# همگام‌سازی ژورنال نسخه محلی با Supabase؛ تغییرهای هر گروه به ترتیب ثبت ارسال می‌شوند
+_replicator: asyncio.Task = None
+_replicate_now = asyncio.Event()
+
+def start_replication():
+    global _replicator
+    if store and _replicator is None:
+        _replicator = asyncio.create_task(_replicate_forever())
+
+async def stop_replication(timeout: float = 5):
+    global _replicator
+    if _replicator is None:
+        return
+    _replicator.cancel()
+    await asyncio.gather(_replicator, return_exceptions=True)
+    _replicator = None
+    # آخرین تلاش؛ هر چه نرسد در فایل می‌ماند و در اجرای بعدی ارسال می‌شود
+    try:
+        await asyncio.wait_for(replicate_pending(), timeout)
+    except Exception as e:
+        print(f"⚠️ {store.backlog()} تغییر همگام‌نشده باقی ماند: {e}")
+
+async def _replicate_forever():
+    while True:
+        try:
+            await replicate_pending()
+        except Exception as e:
+            print(f"❌ خطا در همگام‌سازی با Supabase: {e}")
+        try:
+            await asyncio.wait_for(_replicate_now.wait(), REPLICATION_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _replicate_now.clear()
+
+async def replicate_pending():
+    while True:
+        entries = store.pending(REPLICATION_BATCH)
+        blocked = store.blocked_groups()
+        progressed = False
+
+        for entry_id, kind, group_id, payload, attempts in entries:
+            if group_id in blocked:
+                continue
+            try:
+                response = await _push(kind, group_id, payload)
+            except httpx.HTTPError as e:
+                print(f"⚠️ Supabase در دسترس نیست؛ تغییر {kind} گروه {group_id} بعداً ارسال می‌شود: {e}")
+                response = None
+
+            if response is None or response.status_code >= 500 or response.status_code in [408, 429]:
+                store.retry_later(entry_id, attempts)
+                blocked.add(group_id)
+                continue
+
+            store.done(entry_id)
+            progressed = True
+            if response.status_code >= 400:
+                print(f"⚠️ تغییر {kind} گروه {group_id} رد شد ({response.status_code})؛ نسخه Supabase جایگزین می‌شود")
+            await _reconcile(kind, group_id, payload, response)
+
+        if not progressed or len(entries) < REPLICATION_BATCH:
+            return
+
+async def _push(kind: str, group_id: int, payload: dict):
+    client = get_client()
+    if kind == PATCH_GROUP:
+        return await client.patch(f"/groups?group_id=eq.{group_id}&select={GROUP_COLUMNS}", headers=RETURN_ROW, json=payload)
+    if kind == INSERT_GROUP:
+        return await client.post(f"/groups?select={GROUP_COLUMNS}", headers=RETURN_ROW, json=payload)
+    if kind == INSERT_SUBSCRIPTION:
+        return await client.post("/subscriptions", json=payload)
+    return await client.post("/rpc/change_warning", json=payload)
+
+async def _reconcile(kind: str, group_id: int, payload: dict, response: httpx.Response):
+    # ردیف Supabase مبنا است و تغییرهای محلی هنوز ارسال‌نشده روی آن اعمال می‌شوند
+    if kind in [PATCH_GROUP, INSERT_GROUP]:
+        rows = response.json() if response.status_code == 200 or response.status_code == 201 else []
+        if not rows:
+            remote = await get_client().get(f"/groups?group_id=eq.{group_id}&select={GROUP_COLUMNS}")
+            if remote.status_code != 200:
+                return
+            rows = remote.json()
+        if not rows:
+            # ردیف در Supabase وجود ندارد
+            store.forget_group(group_id)
+            _groups.pop(group_id)
+            return
+        row = {**rows[0], **store.pending_patch(group_id)}
+        store.put_group(row)
+        _groups.set(group_id, row)
+
+    elif kind == INSERT_SUBSCRIPTION:
+        if response.status_code == 409:
+            remote = await get_client().get(f"/subscriptions?group_id=eq.{group_id}&select=end_date")
+            data = remote.json() if remote.status_code == 200 else []
+            if data:
+                store.put_subscription(group_id, data[0]["end_date"])
+                _subscriptions.set(group_id, data[0])
+
+    else:
+        user_id = payload["p_user_id"]
+        if response.status_code == 200:
+            count = response.json()
+        else:
+            count = await _remote_warning_count(group_id, user_id)
+            if count is None:
+                return
+        store.put_warning(group_id, user_id, max(count + store.pending_warning_delta(group_id, user_id), 0))
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from config import FANOUT_CONCURRENCY, FANOUT_RATE, FANOUT_CHAT_INTERVAL, FANOUT_MAX_RETRIES
+
+# زمان مجاز بعدی برای کل ربات و برای هر چت؛ بین همه بررسی‌ها مشترک است
+_next_global = 0.0
+_next_chat = {}
+
+
+async def _wait_for_slot(chat_id: int):
+    global _next_global
+
+    # رزرو نوبت بدون await بین خواندن و نوشتن تا درخواست‌های همزمان نوبت یکسان نگیرند
+    now = time.monotonic()
+    chat_slot = max(now, _next_chat.get(chat_id, 0.0))
+    _next_chat[chat_id] = chat_slot + FANOUT_CHAT_INTERVAL
+    if chat_slot > now:
+        await asyncio.sleep(chat_slot - now)
+        now = time.monotonic()
+
+    slot = max(now, _next_global)
+    _next_global = slot + 1 / FANOUT_RATE
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+
+def _pause(seconds: float):
+    # بعد از RetryAfter همه درخواست‌ها عقب می‌افتند
+    global _next_global
+    _next_global = max(_next_global, time.monotonic() + seconds)
+
+
+async def call(chat_id: int, func, /, *args, **kwargs):
+    # فراخوانی Bot API با رعایت محدودیت سراسری، محدودیت هر چت و RetryAfter
+    for attempt in range(FANOUT_MAX_RETRIES + 1):
+        await _wait_for_slot(chat_id)
+        try:
+            return await func(*args, **kwargs)
+        except RetryAfter as e:
+            if attempt == FANOUT_MAX_RETRIES:
+                raise
+            retry_after = e.retry_after
+            if hasattr(retry_after, "total_seconds"):
+                retry_after = retry_after.total_seconds()
+            print(f"⏳ محدودیت تلگرام؛ {retry_after} ثانیه صبر برای چت {chat_id}")
+            _pause(retry_after)
+
+
+async def run(group_ids, action, concurrency: int = FANOUT_CONCURRENCY):
+    # اجرای action برای هر گروه با حداکثر concurrency کار همزمان؛ نتیجه هر گروه برگردانده می‌شود
+    results = {}
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        while True:
+            group_id = await queue.get()
+            if group_id is None:
+                return
+            try:
+                await action(group_id)
+                results[group_id] = "ok"
+            except Exception as e:
+                results[group_id] = f"{type(e).__name__}: {e}"
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        if hasattr(group_ids, "__aiter__"):
+            async for group_id in group_ids:
+                await queue.put(group_id)
+        else:
+            for group_id in group_ids:
+                await queue.put(group_id)
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        _forget_idle_chats()
+
+    return results
+
+
+def _forget_idle_chats():
+    now = time.monotonic()
+    for chat_id in [chat_id for chat_id, next_at in _next_chat.items() if next_at < now]:
+        del _next_chat[chat_id]
+
+
+def summarize(name: str, results: dict):
+    failed = {group_id: error for group_id, error in results.items() if error != "ok"}
+    print(f"📊 {name}: {len(results) - len(failed)} موفق، {len(failed)} ناموفق")
+    for group_id, error in failed.items():
+        print(f"❌ {name} در گروه {group_id}: {error}")
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+
+from config import FLOOD_MAX_ENTRIES, FLOOD_IDLE_TTL
+
+OK = 0
+FLOODING = 1  # همین الان از حد گذشت
+MUTED = 2     # قبلاً ساکت شده؛ پیام بدون اقدام دوباره نادیده گرفته شود
+
+
+# سطل توکن برای هر (چت، کاربر)؛ ورودی‌های بیکار و قدیمی‌ترین‌ها حذف می‌شوند
+# تا حافظه با هر تعداد کاربر محدود بماند
+class FloodLimiter:
+    def __init__(self, max_entries: int = FLOOD_MAX_ENTRIES, idle_ttl: float = FLOOD_IDLE_TTL):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        # (chat_id, user_id) -> (tokens, last_seen, muted_until)
+        self._buckets = OrderedDict()
+
+    def hit(self, chat_id: int, user_id: int, limit: int, window: float) -> int:
+        now = time.monotonic()
+        key = (chat_id, user_id)
+
+        entry = self._buckets.pop(key, None)
+        if entry is None:
+            tokens, muted_until = float(limit), 0.0
+        else:
+            tokens, last_seen, muted_until = entry
+            tokens = min(float(limit), tokens + (now - last_seen) * limit / window)
+
+        if muted_until > now:
+            result = MUTED
+        elif tokens < 1:
+            result = FLOODING
+        else:
+            tokens -= 1
+            result = OK
+
+        self._buckets[key] = (tokens, now, muted_until)
+        self._evict(now)
+        return result
+
+    def mute(self, chat_id: int, user_id: int, seconds: float):
+        key = (chat_id, user_id)
+        tokens, last_seen, _ = self._buckets.get(key, (0.0, time.monotonic(), 0.0))
+        self._buckets[key] = (tokens, last_seen, time.monotonic() + seconds)
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            key, (_, last_seen, muted_until) = next(iter(buckets.items()))
+            if len(buckets) <= self.max_entries and (last_seen > now - self.idle_ttl or muted_until > now):
+                return
+            del buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+limiter = FloodLimiter()
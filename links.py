@@ -0,0 +1,87 @@
+import re
+from urllib.parse import urlsplit
+
+from telegram import Message, MessageEntity
+
+from cache import TTLCache
+from config import ALLOWLIST_CACHE_TTL, ALLOWLIST_CACHE_SIZE
+from database import get_allowed_domains, update_allowed_domains
+
+LINK_ENTITY_TYPES = [MessageEntity.URL, MessageEntity.TEXT_LINK]
+
+# لینک‌هایی که تلگرام تشخیص نمی‌دهد (t . me/..., hxxp://, example[.]com و ...)
+OBFUSCATED_LINK = re.compile(
+    r"h\s*[tx]\s*[tx]\s*p\s*s?\s*:\s*/\s*/"
+    r"|\bt\s*\.\s*me\s*/"
+    r"|\btelegram\s*\.\s*(?:me|dog)\b"
+    r"|\bwww\s*\.\s*\w"
+    r"|\w\s*(?:\[\s*(?:\.|dot)\s*\]|\(\s*(?:\.|dot)\s*\))\s*\w",
+    re.IGNORECASE
+)
+
+# group_id -> frozenset از دامنه‌های مجاز
+_allowlists = TTLCache(maxsize=ALLOWLIST_CACHE_SIZE, ttl=ALLOWLIST_CACHE_TTL)
+
+
+def normalize_domain(value: str) -> str:
+    value = value.strip().lower()
+    if "://" not in value:
+        value = "http://" + value
+    try:
+        host = urlsplit(value).hostname or ""
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+# دامنه‌های لینک‌های پیام و اینکه لینک مخفی‌شده‌ای دارد یا نه
+def extract_links(message: Message):
+    text = message.text or ""
+    hosts = []
+
+    if message.entities:
+        for entity, value in message.parse_entities(LINK_ENTITY_TYPES).items():
+            url = entity.url if entity.type == MessageEntity.TEXT_LINK else value
+            hosts.append(normalize_domain(url))
+            # لینک‌های شناخته‌شده دوباره با الگو بررسی نشوند
+            text = text.replace(value, " ")
+
+    return hosts, OBFUSCATED_LINK.search(text) is not None
+
+
+def is_allowed(host: str, allowlist) -> bool:
+    # دامنه مجاز شامل زیردامنه‌هایش هم می‌شود
+    while host:
+        if host in allowlist:
+            return True
+        dot = host.find(".")
+        if dot == -1:
+            return False
+        host = host[dot + 1:]
+    return False
+
+
+async def get_allowlist(group_id: int):
+    allowlist = _allowlists.get(group_id)
+    if allowlist is None:
+        allowlist = frozenset(await get_allowed_domains(group_id))
+        _allowlists.set(group_id, allowlist)
+    return allowlist
+
+
+async def set_allowlist(group_id: int, domains) -> bool:
+    domains = sorted(set(domains))
+    if not await update_allowed_domains(group_id, domains):
+        return False
+    _allowlists.set(group_id, frozenset(domains))
+    return True
+
+
+async def is_forbidden(group_id: int, hosts, obfuscated: bool) -> bool:
+    if obfuscated:
+        return True
+    if not hosts:
+        return False
+
+    allowlist = await get_allowlist(group_id)
+    return not all(is_allowed(host, allowlist) for host in hosts)
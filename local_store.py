@@ -0,0 +1,245 @@
+import json
+import sqlite3
+import time
+import uuid
+
+from config import LOCAL_STORE_PATH
+
+# انواع تغییرات ژورنال که باید به Supabase برسند
+PATCH_GROUP = "patch_group"
+INSERT_GROUP = "insert_group"
+INSERT_SUBSCRIPTION = "insert_subscription"
+CHANGE_WARNING = "change_warning"
+
+MAX_RETRY_DELAY = 300
+
+SCHEMA = """
+create table if not exists groups (
+    group_id integer primary key,
+    data text not null
+);
+create table if not exists subscriptions (
+    group_id integer primary key,
+    end_date text
+);
+create table if not exists warnings (
+    group_id integer not null,
+    user_id integer not null,
+    username text,
+    count integer not null,
+    primary key (group_id, user_id)
+);
+create table if not exists members (
+    group_id integer not null,
+    user_id integer not null,
+    username text collate nocase,
+    name text not null,
+    is_bot integer not null,
+    primary key (group_id, user_id)
+);
+create index if not exists members_username on members (group_id, username);
+create table if not exists journal (
+    id integer primary key autoincrement,
+    kind text not null,
+    group_id integer not null,
+    payload text not null,
+    attempts integer not null default 0,
+    next_try real not null default 0
+);
+create index if not exists journal_next_try on journal (next_try, group_id);
+"""
+
+
+# نسخه محلی groups، subscriptions و warnings در SQLite (حالت WAL)؛
+# خواندن‌ها محلی‌اند و هر نوشتن همراه با یک ردیف ژورنال در یک تراکنش ثبت می‌شود.
+# اعضای دیده‌شده گروه‌ها (members) هم اینجا نگه داشته می‌شوند
+class LocalStore:
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("pragma journal_mode=wal")
+        # در WAL با synchronous=normal هر commit نیاز به fsync ندارد
+        self._db.execute("pragma synchronous=normal")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _journal(self, kind: str, group_id: int, payload: dict):
+        self._db.execute(
+            "insert into journal (kind, group_id, payload) values (?, ?, ?)",
+            (kind, group_id, json.dumps(payload))
+        )
+
+    # groups
+    def get_group(self, group_id: int):
+        row = self._db.execute("select data from groups where group_id = ?", (group_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_group(self, row: dict):
+        with self._db:
+            self._db.execute(
+                "insert or replace into groups (group_id, data) values (?, ?)",
+                (row["group_id"], json.dumps(row))
+            )
+
+    def forget_group(self, group_id: int):
+        with self._db:
+            self._db.execute("delete from groups where group_id = ?", (group_id,))
+
+    def insert_group(self, row: dict):
+        with self._db:
+            self._db.execute(
+                "insert or replace into groups (group_id, data) values (?, ?)",
+                (row["group_id"], json.dumps(row))
+            )
+            self._journal(INSERT_GROUP, row["group_id"], row)
+
+    def patch_group(self, group_id: int, data: dict):
+        row = self.get_group(group_id)
+        if row is None:
+            return None
+        row.update(data)
+        with self._db:
+            self._db.execute("update groups set data = ? where group_id = ?", (json.dumps(row), group_id))
+            self._journal(PATCH_GROUP, group_id, data)
+        return row
+
+    def pending_patch(self, group_id: int) -> dict:
+        # ستون‌هایی که هنوز به Supabase نرسیده‌اند؛ بعد از هر همگام‌سازی روی ردیف راه دور اعمال می‌شوند
+        merged = {}
+        for (payload,) in self._db.execute(
+            "select payload from journal where group_id = ? and kind in (?, ?) order by id",
+            (group_id, INSERT_GROUP, PATCH_GROUP)
+        ):
+            merged.update(json.loads(payload))
+        return merged
+
+    # subscriptions
+    def get_subscription(self, group_id: int):
+        row = self._db.execute("select end_date from subscriptions where group_id = ?", (group_id,)).fetchone()
+        return {"end_date": row[0]} if row else None
+
+    def put_subscription(self, group_id: int, end_date: str):
+        with self._db:
+            self._db.execute(
+                "insert or replace into subscriptions (group_id, end_date) values (?, ?)",
+                (group_id, end_date)
+            )
+
+    def insert_subscription(self, data: dict):
+        with self._db:
+            self._db.execute(
+                "insert or replace into subscriptions (group_id, end_date) values (?, ?)",
+                (data["group_id"], data["end_date"])
+            )
+            self._journal(INSERT_SUBSCRIPTION, data["group_id"], data)
+
+    # warnings
+    def get_warning(self, group_id: int, user_id: int):
+        row = self._db.execute(
+            "select count from warnings where group_id = ? and user_id = ?", (group_id, user_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_warning(self, group_id: int, user_id: int, count: int, username: str = None):
+        with self._db:
+            self._db.execute(
+                "insert into warnings (group_id, user_id, username, count) values (?, ?, ?, ?) "
+                "on conflict (group_id, user_id) do update set count = excluded.count, "
+                "username = coalesce(excluded.username, warnings.username)",
+                (group_id, user_id, username, count)
+            )
+
+    def change_warning(self, group_id: int, user_id: int, delta: int, username: str = None) -> int:
+        # مثل تابع change_warning در دیتابیس؛ تغییرها جمع‌پذیرند و بدون تداخل به Supabase می‌رسند
+        count = max((self.get_warning(group_id, user_id) or 0) + delta, 0)
+        with self._db:
+            self._db.execute(
+                "insert into warnings (group_id, user_id, username, count) values (?, ?, ?, ?) "
+                "on conflict (group_id, user_id) do update set count = excluded.count, "
+                "username = coalesce(excluded.username, warnings.username)",
+                (group_id, user_id, username, count)
+            )
+            self._journal(CHANGE_WARNING, group_id, {
+                "p_group_id": group_id,
+                "p_user_id": user_id,
+                "p_username": username,
+                "p_delta": delta,
+                # کلید تکرار؛ اگر پاسخ گم شود ارسال دوباره در Supabase دو بار اعمال نمی‌شود (migrations/010)
+                "p_request_id": str(uuid.uuid4())
+            })
+        return count
+
+    def pending_warning_delta(self, group_id: int, user_id: int) -> int:
+        delta = 0
+        for (payload,) in self._db.execute(
+            "select payload from journal where group_id = ? and kind = ?", (group_id, CHANGE_WARNING)
+        ):
+            payload = json.loads(payload)
+            if payload["p_user_id"] == user_id:
+                delta += payload["p_delta"]
+        return delta
+
+    # اعضای دیده‌شده هر گروه؛ فقط محلی است و به Supabase فرستاده نمی‌شود
+    def get_member(self, group_id: int, user_id: int):
+        return self._db.execute(
+            "select user_id, username, name, is_bot from members where group_id = ? and user_id = ?",
+            (group_id, user_id)
+        ).fetchone()
+
+    def find_member(self, group_id: int, username: str):
+        return self._db.execute(
+            "select user_id, username, name, is_bot from members where group_id = ? and username = ?",
+            (group_id, username)
+        ).fetchone()
+
+    def put_member(self, group_id: int, user_id: int, username: str, name: str, is_bot: bool):
+        with self._db:
+            # یوزرنیم فقط مال یک نفر است؛ صاحب قبلی آن دیگر با این یوزرنیم پیدا نمی‌شود
+            if username:
+                self._db.execute(
+                    "update members set username = null where group_id = ? and username = ? and user_id != ?",
+                    (group_id, username, user_id)
+                )
+            self._db.execute(
+                "insert or replace into members (group_id, user_id, username, name, is_bot) values (?, ?, ?, ?, ?)",
+                (group_id, user_id, username, name, int(is_bot))
+            )
+
+    # ژورنال
+    def pending(self, limit: int = 100):
+        # گروه‌هایی که منتظر تلاش دوباره‌اند کنار گذاشته می‌شوند تا تغییرهای بعدی آن‌ها کل دسته را پر نکنند
+        now = time.time()
+        return [
+            (entry_id, kind, group_id, json.loads(payload), attempts)
+            for entry_id, kind, group_id, payload, attempts in self._db.execute(
+                "select id, kind, group_id, payload, attempts from journal where next_try <= ? "
+                "and group_id not in (select group_id from journal where next_try > ?) order by id limit ?",
+                (now, now, limit)
+            )
+        ]
+
+    def done(self, entry_id: int):
+        with self._db:
+            self._db.execute("delete from journal where id = ?", (entry_id,))
+
+    def retry_later(self, entry_id: int, attempts: int):
+        delay = min(MAX_RETRY_DELAY, 2 ** attempts)
+        with self._db:
+            self._db.execute(
+                "update journal set attempts = ?, next_try = ? where id = ?",
+                (attempts + 1, time.time() + delay, entry_id)
+            )
+
+    def blocked_groups(self):
+        # گروه‌هایی که تغییر زودتری در انتظار تلاش دوباره دارند؛ ترتیب تغییرهای هر گروه حفظ می‌شود
+        now = time.time()
+        return {group_id for (group_id,) in self._db.execute(
+            "select distinct group_id from journal where next_try > ?", (now,)
+        )}
+
+    def backlog(self) -> int:
+        return self._db.execute("select count(*) from journal").fetchone()[0]
+
+
+store = LocalStore(LOCAL_STORE_PATH) if LOCAL_STORE_PATH else None
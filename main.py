@@ -1,32 +1,54 @@
+# زمان شروع پروسه برای گزارش زمان رسیدن اولین آپدیت
+from time import perf_counter
+BOOTED_AT = perf_counter()
+
 import asyncio
 import os
 import uvicorn
 import re
-import requests
+from functools import partial
 from datetime import timedelta, datetime, time, timezone
 from zoneinfo import ZoneInfo
-from pytz import timezone as pytz_timezone
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from telegram import Update, ChatPermissions, Bot
 from telegram.constants import ChatMemberStatus
 from telegram.ext import (
-    Application, ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters, ChatMemberHandler, JobQueue
+    Application, ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, TypeHandler, filters, ChatMemberHandler
 )
 
-from config import BOT_TOKEN, SUPABASE_URL, SUPABASE_API_KEY
-from database import add_group, get_subscription_status, add_warning, remove_warning, get_warning_count, update_lock_status, is_group_locked, get_night_lock_status, update_last_night_lock_applied, update_last_night_lock_released
-
-headers = {
-    "apikey": SUPABASE_API_KEY,
-    "Authorization": f"Bearer {SUPABASE_API_KEY}",
-    "Content-Type": "application/json",
-}
-
-TEHRAN = pytz_timezone("Asia/Tehran")
+from config import BOT_TOKEN, TELEGRAM_API_URL, UPDATE_WORKERS, UPDATE_QUEUE_SIZE, UPDATE_DEDUP_SIZE, AUDIT_EXPORT_TOKEN, SCHEDULE_RETRY_DELAY, SCHEDULE_RETRY_MAX_DELAY
+from admins import ADMIN_STATUSES, is_admin, get_member_status, track_chat_member
+import audit
+import fanout
+import members
+import metrics
+import recent
+import welcome
+import rules
+import spam
+import stats
+from pipeline import process_message
+from local_store import store
+from resilience import breaker_states
+from update_queue import UpdateQueue, SeenUpdates
+from scheduler import Scheduler, UNLOCK, NIGHT_WARNING, NIGHT_START, NIGHT_END, DEFAULT_TIMEZONE, get_zone, parse_time
+from links import get_allowlist, set_allowlist, normalize_domain
+from database import add_group, get_subscription_status, add_warning, remove_warning, get_warning_count, update_lock_status, is_group_locked, get_night_lock_status, update_night_lock, update_night_lock_state, is_night_locked, iter_groups, get_all_groups, close_client, cache_stats, start_replication, stop_replication, update_welcome_settings, update_flood_settings, get_group, get_group_rules, add_group_rule, delete_group_rule
+
+TEHRAN = ZoneInfo("Asia/Tehran")
 
 app = FastAPI()
 application: Application = None  # برای مدیریت بات تلگرام
+update_queue: UpdateQueue = None  # صف پردازش آپدیت‌ها
+seen_updates = SeenUpdates(UPDATE_DEDUP_SIZE)  # آپدیت‌های تکراری قبل از پردازش کنار گذاشته می‌شوند
+scheduler: Scheduler = None  # زمان‌بندی قفل‌ها
+warmup_task: asyncio.Task = None  # ثبت وبهوک و بارگذاری زمان‌بندی در پس‌زمینه
+first_update = True
+
+# پاسخ دستورات وقتی کاربر هدف مشخص نیست
+NO_TARGET = "روی پیام فرد مورد نظر ریپلای کنید یا یوزرنیم یا آیدی عددی او را بنویسید."
 
 # آدرس وبهوک برای تلگرام
 WEBHOOK_PATH = f"/webhook/{BOT_TOKEN}"
@@ -41,11 +63,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     group_id = update.effective_chat.id
     title = update.effective_chat.title or "بدون عنوان"
 
-    if add_group(group_id, title):
+    if await add_group(group_id, title):
         await update.message.reply_text(f"✅ گروه «{title}» با موفقیت ثبت شد.")
 
-    days = get_subscription_status(group_id)
-    if days == -1:
+    days = await get_subscription_status(group_id)
+    if days is None:
+        await update.message.reply_text("⚠️ وضعیت اشتراک فعلاً در دسترس نیست؛ کمی بعد دوباره امتحان کنید.")
+    elif days == -1:
         await update.message.reply_text("❌ اشتراکی برای این گروه پیدا نشد.")
     elif days <= 3:
         await update.message.reply_text(f"⚠️ اشتراک این گروه تا {days} روز دیگر منقضی می‌شود.")
@@ -56,11 +80,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # رویداد شروع برنامه
 @app.on_event("startup")
 async def startup():
-    global application
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+    global application, update_queue, scheduler, warmup_task
+    application = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .request(metrics.BotAPIRequest(connection_pool_size=256))
+        .build()
+    )
+    # کاربران هر آپدیت برای پیدا کردن با یوزرنیم ثبت می‌شوند؛ قبل از هر هندلر دیگری
+    application.add_handler(TypeHandler(Update, members.track_update), group=-2)
+    # همه پیام‌ها یک بار از مراحل ضد اسپم، لینک، کلمات و پاسخ خودکار می‌گذرند؛ قبل از دستورات
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & ~filters.StatusUpdate.ALL, process_message), group=-1)
     application.add_handler(CommandHandler("start", start))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_general_messages), group=1)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, link_filter), group=2)
     application.add_handler(CommandHandler("pin", pin_message))
     application.add_handler(CommandHandler("pinloud", pin_message_loud))
     application.add_handler(CommandHandler("unpin", unpin_message))
@@ -70,41 +102,177 @@ async def startup():
     application.add_handler(CommandHandler("unwarn", unwarn))
     application.add_handler(CommandHandler("ban", ban))
     application.add_handler(CommandHandler("unban", unban))
+    application.add_handler(CommandHandler("purge", purge))
+    application.add_handler(CommandHandler("stats", group_stats))
     application.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, welcome_new_member))
     application.add_handler(CommandHandler("lock", lock))
     application.add_handler(CommandHandler("unlock", unlock))
     application.add_handler(CommandHandler("enablenightlock", enable_night_lock))
     application.add_handler(CommandHandler("disablenightlock", disable_night_lock))
     application.add_handler(CommandHandler("nightlockstatus", nightlock_status))
+    application.add_handler(CommandHandler("settimezone", set_timezone))
+    application.add_handler(CommandHandler("welcomebatch", welcome_batch))
+    application.add_handler(CommandHandler("setflood", set_flood))
+    application.add_handler(CommandHandler("addreply", add_reply_rule))
+    application.add_handler(CommandHandler("addregex", add_regex_rule))
+    application.add_handler(CommandHandler("banword", add_banned_word))
+    application.add_handler(CommandHandler("rules", list_rules))
+    application.add_handler(CommandHandler("delrule", delete_rule))
+    application.add_handler(CommandHandler("allowdomain", allow_domain))
+    application.add_handler(CommandHandler("removedomain", remove_domain))
+    application.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.ANY_CHAT_MEMBER))
+    metrics.instrument_handlers(application)
 
-    # ست کردن وبهوک در تلگرام
-    await application.bot.set_webhook(WEBHOOK_URL)
     await application.initialize()
     await application.start()
 
-    # ✅ اجرای periodic_check بعد از مقداردهی application
-    # asyncio.create_task(periodic_check())
-    
+    update_queue = UpdateQueue(application, UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+    update_queue.start()
+    start_replication()
+    audit.start()
+    stats.start()
+    metrics.gauge("audit_events_pending", "Audit events not yet written to Supabase", audit.pending)
+    metrics.gauge("stats_pending_buckets", "Group-hour activity buckets not yet written to Supabase", stats.pending)
+    if store:
+        metrics.gauge("local_store_backlog", "Local writes not yet replicated to Supabase", store.backlog)
+    metrics.gauge("webhook_queue_depth", "Updates waiting in the webhook queue", lambda: update_queue.depth)
+    metrics.gauge("webhook_queue_rejected", "Updates rejected because the queue was full", lambda: update_queue.rejected)
+    metrics.gauge("webhook_duplicate_updates", "Redelivered updates dropped before parsing", lambda: seen_updates.duplicates)
+    metrics.gauge("member_index_entries", "Known group members in the username index", lambda: len(members.index))
+    metrics.gauge("spam_fingerprints", "Recent message fingerprints tracked across groups", lambda: len(spam.index))
+
+    scheduler = Scheduler()
+    metrics.gauge("scheduled_events", "Pending scheduler events", lambda: len(scheduler))
+    scheduler.on(UNLOCK, partial(check_and_unlock_expired_groups, application.bot))
+    scheduler.on(NIGHT_WARNING, partial(check_and_warn_night_lock, application.bot))
+    scheduler.on(NIGHT_START, partial(check_and_apply_night_lock, application.bot))
+    scheduler.on(NIGHT_END, partial(check_and_release_night_lock, application.bot))
+    scheduler.start()
+
+    # تا پایان startup درخواستی پذیرفته نمی‌شود؛ کارهای کند بعد از آن انجام می‌شوند
+    warmup_task = asyncio.create_task(warm_up())
+    print(f"🚀 آماده دریافت آپدیت‌ها پس از {perf_counter() - BOOTED_AT:.2f} ثانیه")
+
+
+async def warm_up():
+    try:
+        await ensure_webhook()
+    except Exception as e:
+        print(f"❌ خطا در ثبت وبهوک: {e}")
+
+    started = perf_counter()
+    delay = SCHEDULE_RETRY_DELAY
+    # تا یک بارگذاری کامل موفق نشود زمان‌بندی خالی یا ناقص می‌ماند؛ پس دوباره تلاش می‌شود
+    while True:
+        try:
+            if await load_schedule():
+                break
+        except Exception as e:
+            print(f"❌ خطا در بارگذاری زمان‌بندی: {e}")
+        print(f"⏳ بارگذاری زمان‌بندی {delay:g} ثانیه دیگر دوباره انجام می‌شود.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, SCHEDULE_RETRY_MAX_DELAY)
+    print(f"🔥 گرم شدن در {perf_counter() - started:.2f} ثانیه")
+
+
+# ثبت وبهوک فقط وقتی که آدرس یا نوع آپدیت‌ها تغییر کرده باشد
+async def ensure_webhook():
+    info = await application.bot.get_webhook_info()
+    if info.url == WEBHOOK_URL and set(info.allowed_updates or ()) == set(Update.ALL_TYPES):
+        print(f"✅ Webhook already set to {WEBHOOK_URL}")
+        return
+
+    # رویدادهای chat_member به‌طور پیش‌فرض ارسال نمی‌شوند
+    await application.bot.set_webhook(WEBHOOK_URL, allowed_updates=Update.ALL_TYPES)
     print(f"✅ Webhook set to {WEBHOOK_URL}")
 
+# رویداد خاموش شدن برنامه
+@app.on_event("shutdown")
+async def shutdown():
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if scheduler:
+        await scheduler.stop()
+    if update_queue:
+        await update_queue.stop()
+    if application:
+        await welcome.flush_all(application.bot)
+        await application.stop()
+        await application.shutdown()
+    await audit.stop()
+    await stats.stop()
+    await stop_replication()
+    await close_client()
+
 # هندل کردن پیام‌های دریافتی از تلگرام
 @app.post(WEBHOOK_PATH)
 async def webhook_handler(request: Request):
-    data = await request.json()
-    update = Update.de_json(data, application.bot)
-    await application.process_update(update)
+    global first_update
+    try:
+        data = await request.json()
+        # ارسال دوباره یک آپدیت بدون ساختن Update و بدون اجرای دوباره هندلرها تأیید می‌شود
+        if seen_updates.seen(data["update_id"]):
+            return {"status": "duplicate"}
+        update = Update.de_json(data, application.bot)
+    except Exception:
+        return JSONResponse({"status": "invalid update"}, status_code=400)
+
+    if first_update:
+        first_update = False
+        print(f"⏱ اولین آپدیت پس از {perf_counter() - BOOTED_AT:.2f} ثانیه از شروع پروسه رسید.")
+
+    # پاسخ فوری به تلگرام؛ پردازش در پس‌زمینه انجام می‌شود
+    if not update_queue.submit(update):
+        # صف پر است؛ تلگرام بعداً دوباره ارسال می‌کند و این بار نباید تکراری حساب شود
+        return JSONResponse({"status": "busy"}, status_code=503)
+    seen_updates.add(update.update_id)
     return {"status": "ok"}
 
+@app.get("/queue")
+async def queue_status():
+    return {
+        "depth": update_queue.depth if update_queue else 0,
+        "max_depth": UPDATE_QUEUE_SIZE,
+        "rejected": update_queue.rejected if update_queue else 0,
+        "duplicates": seen_updates.duplicates
+    }
+
+# خروجی گزارش اقدامات یک گروه به شکل NDJSON: /audit/<group_id>?after=<id آخرین ردیف قبلی>&limit=1000
+@app.get("/audit/{group_id}")
+async def audit_export(group_id: int, request: Request, after: int = 0, limit: int = 1000):
+    if not AUDIT_EXPORT_TOKEN or request.headers.get("authorization") != f"Bearer {AUDIT_EXPORT_TOKEN}":
+        return JSONResponse({"status": "forbidden"}, status_code=403)
+    return StreamingResponse(audit.export(group_id, after, limit), media_type="application/x-ndjson")
+
+@app.get("/cache")
+async def cache_status():
+    return cache_stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# فقط بررسی زنده بودن سرویس؛ قفل‌ها توسط scheduler انجام می‌شوند
 @app.api_route("/", methods=["GET", "HEAD"])
 async def ping():
     now = datetime.now(TEHRAN).strftime("%Y-%m-%d %H:%M:%S")
-    print(f"📡 پینگ UptimeRobot انجام شد - زمان: {now}")
-    await check_and_warn_night_lock(application.bot)
-    await check_and_unlock_expired_groups(application.bot)
-    await check_and_apply_night_lock(application.bot)
-    await check_and_release_night_lock(application.bot)
     return {"status": f"Pinged at {now}"}
 
+# آماده بودن برای پردازش آپدیت‌ها
+@app.get("/ready")
+async def ready():
+    is_ready = (
+        application is not None
+        and application.running
+        and update_queue is not None
+        and scheduler is not None
+        and scheduler.running
+    )
+    if not is_ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    # مدار باز یعنی ربات با داده‌های کش‌شده کار می‌کند
+    return {"status": "ready", "supabase": breaker_states()}
+
 
 # اجرای برنامه با uvicorn
 if __name__ == "__main__":
@@ -112,63 +280,161 @@ if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=port)
 
 
-# مشخص کردن کاربر
+# تنظیم ضد اسپم: /setflood 5 10 یا /setflood off
+async def set_flood(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند تنظیمات ضد اسپم را تغییر دهند.")
+        return
+
+    if context.args and context.args[0].lower() == "off":
+        limit, window = 0, None
+    else:
+        try:
+            limit, window = int(context.args[0]), float(context.args[1])
+        except (IndexError, ValueError):
+            await update.message.reply_text("❌ مثال: /setflood 5 10 (حداکثر ۵ پیام در ۱۰ ثانیه) یا /setflood off")
+            return
+        if limit < 1 or window <= 0:
+            await update.message.reply_text("❌ تعداد و بازه باید بزرگ‌تر از صفر باشند.")
+            return
+
+    if not await update_flood_settings(chat_id, limit, window):
+        await update.message.reply_text("⚠️ خطا در ذخیره تنظیمات ضد اسپم.")
+    elif limit == 0:
+        await update.message.reply_text("✅ ضد اسپم در این گروه غیرفعال شد.")
+    else:
+        await update.message.reply_text(f"✅ حداکثر {limit} پیام در {window:g} ثانیه مجاز است.")
+
+
+# مشخص کردن کاربر: ریپلای، آیدی عددی یا یوزرنیم؛ آرگومان‌های باقی‌مانده هم برگردانده می‌شوند
 async def get_target_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+
     # اگر ریپلای کرده بود
     if update.message.reply_to_message:
-        return update.message.reply_to_message.from_user
+        return update.message.reply_to_message.from_user, args
 
-    # اگر آرگومان داده بود
-    if context.args:
-        user_input = context.args[0]
+    if not args:
+        return None, args
+    user_input, rest = args[0], args[1:]
+    chat_id = update.effective_chat.id
+
+    # اگر یوزرنیم بود (Bot API جستجو با یوزرنیم ندارد؛ از کاربران دیده‌شده در گروه)
+    if user_input.startswith('@'):
+        return members.index.find(chat_id, user_input), rest
+
+    # اگر آیدی عددی بود
+    if user_input.isdigit():
+        user = members.index.get(chat_id, int(user_input))
+        if user:
+            return user, rest
+        try:
+            user = (await context.bot.get_chat_member(chat_id, int(user_input))).user
+        except Exception:
+            return None, rest
+        members.index.remember(chat_id, user)
+        return user, rest
+
+    return None, args
 
-        # اگر آیدی عددی بود
-        if user_input.isdigit():
-            try:
-                return await context.bot.get_chat_member(update.effective_chat.id, int(user_input)).user
-            except:
-                return None
 
-        # اگر یوزرنیم بود
-        if user_input.startswith('@'):
-            try:
-                return await context.bot.get_chat_member(update.effective_chat.id, user_input).user
-            except:
-                return None
+# مدیریت قوانین گروه
+async def add_reply_rule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await add_rule(update, context, rules.REPLY)
 
-    return None
+async def add_regex_rule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await add_rule(update, context, rules.REGEX)
 
+async def add_banned_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await add_rule(update, context, rules.BANNED)
 
-BOT_NAME = "ربات"
+async def add_rule(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str):
+    chat_id = update.effective_chat.id
 
-async def handle_general_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message:
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند قوانین گروه را تغییر دهند.")
         return
 
-    text = update.message.text.lower().strip()
-    user_name = update.effective_user.first_name
+    # /addreply کلمه | پاسخ   —   /addregex الگو | پاسخ   —   /banword کلمه
+    args = update.message.text.split(maxsplit=1)
+    pattern, _, response_text = (args[1] if len(args) > 1 else "").partition("|")
+    pattern, response_text = pattern.strip(), response_text.strip()
+
+    if kind != rules.REGEX:
+        pattern = pattern.lower()
+    if not pattern or (kind != rules.BANNED and not response_text):
+        examples = {
+            rules.REPLY: "/addreply قیمت | برای قیمت به ادمین پیام بدید",
+            rules.REGEX: "/addregex ساعت\\s*چند | {name} الان وقت کار است",
+            rules.BANNED: "/banword کلمه"
+        }
+        await update.message.reply_text(f"❌ مثال: {examples[kind]}")
+        return
 
-    # حالت سلام خالی
-    if text == "سلام":
-        await update.message.reply_text(f"سلام {user_name}! امیدوارم حالت خوب باشه 🌸")
+    if kind == rules.REGEX:
+        error = rules.validate_regex(pattern)
+        if error:
+            await update.message.reply_text(f"❌ {error}")
+            return
+    elif len(pattern) > rules.MAX_PATTERN_LENGTH:
+        await update.message.reply_text("❌ عبارت بیش از حد طولانی است.")
         return
 
-    # حالت صدا زدن ربات (مثل: ربات، ربات جان، سلام ربات و ...)
-    if BOT_NAME in text:
-        await update.message.reply_text(
-            f"جانم {user_name}! در صورتی که کاری دارید با ادمین‌ها درمیون بزارید تا هوشمندتر بشم 🤖"
-        )
+    if not await add_group_rule(chat_id, kind, pattern, response_text or None):
+        await update.message.reply_text("⚠️ خطا در ذخیره قانون.")
+        return
+
+    await rules.reload(chat_id)
+    await update.message.reply_text("✅ قانون جدید ثبت شد.")
+
+async def list_rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند قوانین گروه را ببینند.")
+        return
+
+    group_rules = await get_group_rules(chat_id)
+    if group_rules is None:
+        await update.message.reply_text("⚠️ خطا در دریافت قوانین.")
+        return
+    if not group_rules:
+        await update.message.reply_text("📋 هنوز قانونی برای این گروه ثبت نشده.")
+        return
+
+    labels = {rules.REPLY: "پاسخ", rules.REGEX: "regex", rules.BANNED: "ممنوع"}
+    lines = [
+        f"{rule['id']}. [{labels.get(rule['kind'], rule['kind'])}] {rule['pattern']}"
+        + (f" ← {rule['response']}" if rule.get("response") else "")
+        for rule in group_rules
+    ]
+    await update.message.reply_text("📋 قوانین گروه:\n" + "\n".join(lines))
+
+async def delete_rule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند قوانین گروه را تغییر دهند.")
         return
 
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("❌ مثال: /delrule 12 (شماره قانون از /rules)")
+        return
+
+    if await delete_group_rule(chat_id, int(context.args[0])):
+        await rules.reload(chat_id)
+        await update.message.reply_text("🗑 قانون حذف شد.")
+    else:
+        await update.message.reply_text("❌ قانونی با این شماره پیدا نشد.")
+
 
 async def pin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
 
-    chat_admins = await context.bot.get_chat_administrators(chat_id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-    
-    if user_id not in admin_ids:
+    if not await is_admin(context.bot, chat_id, user_id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند پیام را پین کنند.")
         return
 
@@ -191,10 +457,7 @@ async def pin_message_loud(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
 
-    chat_admins = await context.bot.get_chat_administrators(chat_id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if user_id not in admin_ids:
+    if not await is_admin(context.bot, chat_id, user_id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند پیام را پین کنند.")
         return
 
@@ -217,10 +480,7 @@ async def unpin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
 
-    chat_admins = await context.bot.get_chat_administrators(chat_id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if user_id not in admin_ids:
+    if not await is_admin(context.bot, chat_id, user_id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند پیام را آنپین کنند.")
         return
 
@@ -234,30 +494,31 @@ async def unpin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # اخطار به کاربر
 async def warn(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if update.effective_user.id not in admin_ids:
+    if not await is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند اخطار بدهند.")
         return
 
-    user = update.message.reply_to_message.from_user if update.message.reply_to_message else None
+    user, _ = await get_target_user(update, context)
     if not user:
-        await update.message.reply_text("باید روی پیام فرد مورد نظر ریپلای کنید.")
+        await update.message.reply_text(NO_TARGET)
         return
 
-    member = await context.bot.get_chat_member(update.effective_chat.id, user.id)
-    issuer = await context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
+    member_status = await get_member_status(context.bot, update.effective_chat.id, user.id)
+    issuer_status = await get_member_status(context.bot, update.effective_chat.id, update.effective_user.id)
 
     if user.id == context.bot.id:
         await update.message.reply_text("❌ نمی‌توانید به ربات اخطار بدهید.")
         return
 
-    if member.status in ['administrator', 'creator'] and issuer.status != 'creator':
+    if member_status in ADMIN_STATUSES and issuer_status != ChatMemberStatus.OWNER:
         await update.message.reply_text("❌ فقط صاحب گروه می‌تواند روی ادمین‌ها اعمالی انجام دهد.")
         return
 
-    count = add_warning(update.effective_chat.id, user.id, user.username or "بدون‌نام")
+    count = await add_warning(update.effective_chat.id, user.id, user.username or "بدون‌نام")
+    if count is None:
+        await update.message.reply_text("⚠️ ثبت اخطار فعلاً ممکن نیست؛ کمی بعد دوباره امتحان کنید.")
+        return
+    audit.record(update.effective_chat.id, audit.WARN, update.effective_user.id, user.id, count=count)
     await update.message.reply_text(
         f"⚠️ به کاربر {user.mention_html()} اخطار شماره {count} داده شد.",
         parse_mode='HTML'
@@ -270,59 +531,65 @@ async def warn(update: Update, context: ContextTypes.DEFAULT_TYPE):
             permissions=ChatPermissions(can_send_messages=False),
             until_date=datetime.utcnow() + timedelta(hours=1)
         )
+        audit.record(update.effective_chat.id, audit.MUTE, None, user.id, duration="1h", reason="warnings")
         await update.message.reply_text(
             f"🚫 کاربر {user.mention_html()} به دلیل دریافت ۳ اخطار، به مدت ۱ ساعت ساکت شد.",
             parse_mode='HTML'
         )
 
-# خوش آمد گویی
+# خوش آمد گویی (ورودهای نزدیک به هم در یک پیام)
 async def welcome_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    for user in update.message.new_chat_members:
-        tehran_tz = pytz.timezone('Asia/Tehran')
-        now = datetime.now(tehran_tz).strftime("%Y/%m/%d ساعت %H:%M")
+    await welcome.add_members(context.bot, update.effective_chat, update.message.new_chat_members)
 
-        group_title = update.effective_chat.title  # گرفتن اسم گروه
 
-        text = (
-            f"🌸 سلام {user.mention_html()} عزیز! 👋\n\n"
-            f"به گپ {group_title} خوش اومدی! 🎉\n\n"
-            f"🕒 تاریخ و زمان ورود: {now} 🌹"
-        )
+# تنظیم تجمیع پیام خوش‌آمد: /welcomebatch 10 30
+async def welcome_batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
 
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=text,
-            parse_mode="HTML"
-        )
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند تنظیمات خوش‌آمد را تغییر دهند.")
+        return
+
+    try:
+        window, batch = float(context.args[0]), int(context.args[1])
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ مثال: /welcomebatch 10 30 (بازه به ثانیه و حداکثر تعداد کاربر در هر پیام)")
+        return
+
+    if not (0 < window <= 300 and 1 <= batch <= welcome.MAX_BATCH_LIMIT):
+        await update.message.reply_text(f"❌ بازه باید بین ۱ تا ۳۰۰ ثانیه و تعداد بین ۱ تا {welcome.MAX_BATCH_LIMIT} باشد.")
+        return
+
+    if await update_welcome_settings(chat_id, window, batch):
+        await update.message.reply_text(f"✅ خوش‌آمد ورودهای هر {window:g} ثانیه در یک پیام (حداکثر {batch} نفر) ارسال می‌شود.")
+    else:
+        await update.message.reply_text("⚠️ خطا در ذخیره تنظیمات خوش‌آمد.")
 
 
 
 # دستور ساکت شدن کاربر
 async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if update.effective_user.id not in admin_ids:
+    if not await is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند سکوت کنند.")
         return
 
-    user = update.message.reply_to_message.from_user if update.message.reply_to_message else None
+    user, args = await get_target_user(update, context)
     if not user:
-        await update.message.reply_text("باید روی پیام فرد مورد نظر ریپلای کنی.")
+        await update.message.reply_text(NO_TARGET)
         return
 
-    member = await context.bot.get_chat_member(update.effective_chat.id, user.id)
-    issuer = await context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
+    member_status = await get_member_status(context.bot, update.effective_chat.id, user.id)
+    issuer_status = await get_member_status(context.bot, update.effective_chat.id, update.effective_user.id)
 
     if user.id == context.bot.id:
         await update.message.reply_text("❌ نمی‌توانید ربات را محدود کنید.")
         return
 
-    if member.status in ['administrator', 'creator'] and issuer.status != 'creator':
+    if member_status in ADMIN_STATUSES and issuer_status != ChatMemberStatus.OWNER:
         await update.message.reply_text("❌ فقط صاحب گروه می‌تواند روی ادمین‌ها اعمالی انجام دهد.")
         return
 
-    duration = context.args[0] if context.args else "10m"
+    duration = args[0] if args else "10m"
     match = re.match(r"(\d+)([smhd])", duration)
     if not match:
         await update.message.reply_text("فرمت زمان نامعتبر است. مثال: 10m یا 2h")
@@ -339,15 +606,13 @@ async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
         permissions=ChatPermissions(can_send_messages=False),
         until_date=until_date
     )
+    audit.record(update.effective_chat.id, audit.MUTE, update.effective_user.id, user.id, duration=duration)
     await update.message.reply_text(f"🔇 کاربر {user.mention_html()} برای {duration} ساکت شد.", parse_mode='HTML')
 
 # دستور حذف سکوت کاربر
 async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # فقط ادمین‌ها اجازه دارند
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if update.effective_user.id not in admin_ids:
+    if not await is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند سکوت را بردارند.")
         return
 
@@ -374,15 +639,13 @@ async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE):
 )
     )
 
+    audit.record(update.effective_chat.id, audit.UNMUTE, update.effective_user.id, user_to_unmute.id)
     await update.message.reply_text(f"🔓 @{user_to_unmute.username or 'کاربر'} از حالت سکوت خارج شد.")
 
 
 # حذف همه اخطارها
 async def unwarn(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-    
-    if update.effective_user.id not in admin_ids:
+    if not await is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند اخطار را حذف کنند.")
         return
 
@@ -392,45 +655,75 @@ async def unwarn(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     count_to_remove = int(context.args[0]) if context.args and context.args[0].isdigit() else 1
-    new_count = remove_warning(update.effective_chat.id, user.id, count_to_remove)
+    new_count = await remove_warning(update.effective_chat.id, user.id, count_to_remove)
+    if new_count is None:
+        await update.message.reply_text("⚠️ حذف اخطار فعلاً ممکن نیست؛ کمی بعد دوباره امتحان کنید.")
+        return
+    audit.record(update.effective_chat.id, audit.UNWARN, update.effective_user.id, user.id, removed=count_to_remove, count=new_count)
     await update.message.reply_text(f"ℹ️ اخطارهای @{user.username} کم شد. تعداد جدید: {new_count}")
 
 
 # دستور بن کردن
 async def ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if update.effective_user.id not in admin_ids:
+    if not await is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند کاربران را بن کنند.")
         return
 
-    user = update.message.reply_to_message.from_user if update.message.reply_to_message else None
+    user, args = await get_target_user(update, context)
     if not user:
-        await update.message.reply_text("باید روی پیام فرد مورد نظر ریپلای کنید.")
+        await update.message.reply_text(NO_TARGET)
         return
 
-    member = await context.bot.get_chat_member(update.effective_chat.id, user.id)
-    issuer = await context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
+    member_status = await get_member_status(context.bot, update.effective_chat.id, user.id)
+    issuer_status = await get_member_status(context.bot, update.effective_chat.id, update.effective_user.id)
 
     if user.id == context.bot.id:
         await update.message.reply_text("❌ نمی‌توانید ربات را بن کنید.")
         return
 
-    if member.status in ['administrator', 'creator'] and issuer.status != 'creator':
+    if member_status in ADMIN_STATUSES and issuer_status != ChatMemberStatus.OWNER:
         await update.message.reply_text("❌ فقط صاحب گروه می‌تواند روی ادمین‌ها اعمالی انجام دهد.")
         return
 
     await context.bot.ban_chat_member(update.effective_chat.id, user.id)
+    audit.record(update.effective_chat.id, audit.BAN, update.effective_user.id, user.id)
     await update.message.reply_text(f"🚫 کاربر {user.mention_html()} از گروه بن شد.", parse_mode='HTML')
 
+    # /ban del: پیام‌های اخیر کاربر هم حذف شوند
+    if args and args[0].lower() == "del":
+        message_ids = recent.messages.from_user(update.effective_chat.id, user.id)
+        deleted = await recent.delete_messages(context.bot, update.effective_chat.id, message_ids)
+        audit.record(update.effective_chat.id, audit.PURGE, update.effective_user.id, user.id, deleted=deleted)
+        await update.message.reply_text(f"🧹 {deleted} پیام اخیر این کاربر حذف شد.")
+
+
+# حذف آخرین پیام‌های گروه: /purge 50
+async def purge(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند پیام‌ها را پاک کنند.")
+        return
+
+    try:
+        count = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text(f"❌ مثال: /purge 50 (حداکثر {recent.messages.size} پیام)")
+        return
+    if not 1 <= count <= recent.messages.size:
+        await update.message.reply_text(f"❌ تعداد باید بین ۱ تا {recent.messages.size} باشد.")
+        return
+
+    # خود دستور هم جزو پیام‌های ثبت‌شده است و همراه بقیه حذف می‌شود
+    message_ids = recent.messages.latest(chat_id, count + 1)
+    deleted = await recent.delete_messages(context.bot, chat_id, message_ids)
+    audit.record(chat_id, audit.PURGE, update.effective_user.id, deleted=max(deleted - 1, 0))
+    await context.bot.send_message(chat_id, f"🧹 {max(deleted - 1, 0)} پیام حذف شد.")
+
 
 # دستور آن‌بن کردن
 async def unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-    
-    if update.effective_user.id not in admin_ids:
+    if not await is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند از بن خارج کنند.")
         return
 
@@ -440,23 +733,96 @@ async def unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     await context.bot.unban_chat_member(update.effective_chat.id, user.id)
+    audit.record(update.effective_chat.id, audit.UNBAN, update.effective_user.id, user.id)
     await update.message.reply_text(f"✅ @{user.username or 'کاربر'} از بن خارج شد.")
 
 
-# حذف لینک
-async def link_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    message = update.message
-    if not message or not message.text:
+# آمار ۲۴ ساعت گذشته گروه: /stats
+async def group_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند آمار گروه را ببینند.")
+        return
+
+    summary = await stats.summary(chat_id)
+    if summary is None:
+        await update.message.reply_text("⚠️ خواندن آمار فعلاً ممکن نیست؛ کمی بعد دوباره امتحان کنید.")
+        return
+    if not summary["messages"]:
+        await update.message.reply_text("📊 در ۲۴ ساعت گذشته پیامی ثبت نشده است.")
         return
 
-    if "http://" in message.text or "https://" in message.text or "t.me" in message.text:
-        sender = await context.bot.get_chat_member(update.effective_chat.id, message.from_user.id)
-        if sender.status not in ['administrator', 'creator']:
-            await message.delete()
-            count = add_warning(update.effective_chat.id, message.from_user.id, message.from_user.username or "بدون‌نام")
-            await message.reply_text(
-                f"❌ ارسال لینک بدون هماهنگی با ادمین ممنوع است.\n⚠️ اخطار شماره {count} ثبت شد."
-            )
+    group = await get_group(chat_id) or {}
+    zone = get_zone(group.get("timezone") or DEFAULT_TIMEZONE) or TEHRAN
+    busiest = max(summary["hourly"].values())
+    # بازه‌ها ساعت‌های کامل UTC هستند؛ شروع واقعی به وقت محلی نشان داده می‌شود (مثلاً 10:30 در تهران)
+    hourly = "\n".join(
+        f"{datetime.fromtimestamp(hour * 3600, zone):%H:%M} {'▇' * max(1, round(10 * count / busiest))} {count}"
+        for hour, count in summary["hourly"].items()
+    )
+
+    top_lines = []
+    for rank, (user_id, count) in enumerate(summary["top"][:5], start=1):
+        user = members.index.get(chat_id, user_id)
+        name = user.mention_html() if user else f"<code>{user_id}</code>"
+        top_lines.append(f"{rank}. {name}: {count}")
+
+    await update.message.reply_text(
+        f"📊 آمار ۲۴ ساعت گذشته\n\n"
+        f"💬 پیام‌ها: {summary['messages']}\n"
+        f"👥 کاربران فعال (تقریبی): {summary['unique_users']}\n\n"
+        f"🏆 پرکارترین‌ها:\n" + "\n".join(top_lines) + "\n\n"
+        f"🕒 پیام‌ها در هر ساعت:\n{hourly}",
+        parse_mode='HTML'
+    )
+
+
+# مدیریت دامنه‌های مجاز
+async def allow_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند دامنه‌های مجاز را تغییر دهند.")
+        return
+
+    allowlist = await get_allowlist(chat_id)
+    if not context.args:
+        if allowlist:
+            await update.message.reply_text("🔗 دامنه‌های مجاز:\n" + "\n".join(sorted(allowlist)))
+        else:
+            await update.message.reply_text("🔗 هیچ دامنه مجازی ثبت نشده. مثال: /allowdomain example.com")
+        return
+
+    domains = [normalize_domain(arg) for arg in context.args]
+    domains = [domain for domain in domains if domain]
+    if not domains:
+        await update.message.reply_text("❌ دامنه نامعتبر است. مثال: /allowdomain example.com")
+        return
+
+    if await set_allowlist(chat_id, allowlist | set(domains)):
+        await update.message.reply_text(f"✅ دامنه‌های {'، '.join(domains)} مجاز شدند.")
+    else:
+        await update.message.reply_text("⚠️ خطا در ذخیره دامنه‌های مجاز.")
+
+
+async def remove_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند دامنه‌های مجاز را تغییر دهند.")
+        return
+
+    domains = {normalize_domain(arg) for arg in context.args or []}
+    if not domains:
+        await update.message.reply_text("❌ مثال: /removedomain example.com")
+        return
+
+    allowlist = await get_allowlist(chat_id)
+    if await set_allowlist(chat_id, allowlist - domains):
+        await update.message.reply_text("🗑 دامنه از لیست مجاز حذف شد.")
+    else:
+        await update.message.reply_text("⚠️ خطا در ذخیره دامنه‌های مجاز.")
 
 
 # قفل گروه
@@ -464,10 +830,7 @@ async def lock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
 
-    chat_admins = await context.bot.get_chat_administrators(chat_id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if user_id not in admin_ids:
+    if not await is_admin(context.bot, chat_id, user_id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند گروه را قفل کنند.")
         return
 
@@ -493,9 +856,15 @@ async def lock(update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id=chat_id,
         permissions=ChatPermissions(can_send_messages=False)
     )
+    audit.record(chat_id, audit.LOCK, user_id, until=until.isoformat() if until else None)
 
-    # ذخیره در دیتابیس
-    update_lock_status(chat_id, True, until.isoformat() if until else None)
+    # ذخیره در دیتابیس و زمان‌بندی باز شدن خودکار
+    if not await update_lock_status(chat_id, True, until.isoformat() if until else None):
+        await update.message.reply_text("⚠️ گروه قفل شد اما وضعیت آن ذخیره نشد.")
+    if until:
+        scheduler.schedule(chat_id, UNLOCK, until.replace(tzinfo=timezone.utc))
+    else:
+        scheduler.cancel(chat_id, UNLOCK)
 
     duration_text = ""
     if until:
@@ -509,94 +878,88 @@ async def lock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"🔒 گروه قفل شد{duration_text}.")
 
 
-async def check_and_unlock_expired_groups(bot: Bot):
-    url = f"{SUPABASE_URL}/rest/v1/groups?select=group_id,lock_until,is_locked"
-    response = requests.get(url, headers=headers)
-
-    if response.status_code != 200:
-        return
-
-    for group in response.json():
-        group_id = group["group_id"]
-        is_locked = group["is_locked"]
-        lock_until = group.get("lock_until")
-
-        if is_locked and lock_until:
-            lock_until_dt = datetime.fromisoformat(lock_until)
-            if datetime.now(timezone.utc) > lock_until_dt:
-                # باز کردن گروه
-                await bot.set_chat_permissions(
-                    chat_id=group_id,
-                    permissions=ChatPermissions(
-                        can_send_messages=True,
-                        can_send_audios=True,
-                        can_send_documents=True,
-                        can_send_photos=True,
-                        can_send_videos=True,
-                        can_send_video_notes=True,
-                        can_send_voice_notes=True,
-                        can_send_polls=True,
-                        can_send_other_messages=True,
-                        can_add_web_page_previews=True
-                    )
-                )
-                
-                print(f"🔓 باز کردن خودکار گروه {group_id} چون زمانش تموم شده.")
-                
-                # پیام باز شدن خودکار
-                try:
-                    await bot.send_message(
-                        chat_id=group_id,
-                        text="🔓 قفل گروه به‌صورت خودکار باز شد."
-                    )
-                except:
-                    pass  # اگر ربات بن شده بود یا نتونست پیام بده
-
-                # بروزرسانی دیتابیس
-                update_lock_status(group_id, False, None)
-
-async def check_and_warn_night_lock(bot: Bot):
-    now = datetime.utcnow()
-    if now.hour == 22 and 20 <= now.minute < 30:  # بازه 01:50 تا 02:00 به وقت ایران
-        print("⏰ در حال ارسال هشدار قفل شبانه...")
-
-        url = f"{SUPABASE_URL}/rest/v1/groups?select=group_id,night_lock_active"
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            return
+async def group_ids(groups):
+    async for group in groups:
+        yield group["group_id"]
 
-        for group in response.json():
-            if group.get("night_lock_active", False):
-                try:
-                    await bot.send_message(
-                        chat_id=group["group_id"],
-                        text=(
-                            "🔔 هشدار: قفل شبانه تا لحظاتی دیگر (ساعت ۲ بامداد ایران) فعال می‌شود.\n"
-                            "در صورت نیاز به غیرفعال‌سازی، لطفاً با ادمین گروه تماس بگیرید تا از دستور /disable_nightlock استفاده بکند."
-                        )
-                    )
-                except Exception as e:
-                    print(f"❌ خطا در ارسال هشدار به گروه {group['group_id']}: {e}")
-    else:
-        print(f"🕑 زمان فعلی UTC: {now.hour}:{now.minute:02d} - خارج از بازه هشدار")
+@metrics.timed(metrics.sweep_seconds, "unlock")
+async def check_and_unlock_expired_groups(bot: Bot, due_groups: list = None):
+    now_utc = datetime.now(timezone.utc)
+    # فقط گروه‌هایی که زمان قفلشان گذشته از دیتابیس خوانده می‌شوند
+    group_filters = {"is_locked": "eq.true", "lock_until": f"lt.{now_utc.isoformat()}"}
+
+    async def release(group_id):
+        # باز کردن گروه
+        await fanout.call(
+            group_id,
+            bot.set_chat_permissions,
+            chat_id=group_id,
+            permissions=ChatPermissions(
+                can_send_messages=True,
+                can_send_audios=True,
+                can_send_documents=True,
+                can_send_photos=True,
+                can_send_videos=True,
+                can_send_video_notes=True,
+                can_send_voice_notes=True,
+                can_send_polls=True,
+                can_send_other_messages=True,
+                can_add_web_page_previews=True
+            )
+        )
 
+        print(f"🔓 باز کردن خودکار گروه {group_id} چون زمانش تموم شده.")
+        audit.record(group_id, audit.AUTO_UNLOCK)
 
-# ✅ سپس بلافاصله بعدش:
-# async def periodic_check():
-#    while True:
-#        print("🔁 در حال بررسی گروه‌های قفل‌شده...")
- #       await check_and_warn_night_lock(application.bot)  # هشدار
-  #      await check_and_unlock_expired_groups(application.bot)
-   #     await check_and_apply_night_lock(application.bot)  # ✅ قفل شبانه
-    #    await check_and_release_night_lock(application.bot)  # ✅ باز کردن صبح
-     #   await asyncio.sleep(60)
+        # پیام باز شدن خودکار
+        try:
+            await fanout.call(group_id, bot.send_message, chat_id=group_id, text="🔓 قفل گروه به‌صورت خودکار باز شد.")
+        except:
+            pass  # اگر ربات بن شده بود یا نتونست پیام بده
+
+        # بروزرسانی دیتابیس
+        await update_lock_status(group_id, False, None)
+
+    results = await fanout.run(group_ids(iter_groups("group_id", group_filters, group_ids=due_groups)), release)
+    if results:
+        fanout.summarize("باز کردن خودکار", results)
+
+@metrics.timed(metrics.sweep_seconds, "night_warning")
+async def check_and_warn_night_lock(bot: Bot, due_groups: list = None):
+    print("⏰ در حال ارسال هشدار قفل شبانه...")
+
+    async def warn_group(group_id):
+        start, _ = scheduler.window(group_id)
+        await fanout.call(
+            group_id,
+            bot.send_message,
+            chat_id=group_id,
+            text=(
+                f"🔔 هشدار: قفل شبانه تا لحظاتی دیگر (ساعت {start}) فعال می‌شود.\n"
+                "در صورت نیاز به غیرفعال‌سازی، لطفاً با ادمین گروه تماس بگیرید تا از دستور /disablenightlock استفاده بکند."
+            )
+        )
 
+    group_filters = {"night_lock_active": "eq.true"}
+    results = await fanout.run(group_ids(iter_groups("group_id", group_filters, group_ids=due_groups)), warn_group)
+    fanout.summarize("هشدار قفل شبانه", results)
+
+
+# بارگذاری رویدادهای زمان‌بندی (قفل‌های زمان‌دار و قفل شبانه) در شروع برنامه؛ False یعنی خواندن ناقص ماند
+async def load_schedule():
+    select = "group_id,night_lock_active,is_locked,lock_until,timezone,night_lock_start,night_lock_end"
+    group_filters = {"or": "(night_lock_active.eq.true,and(is_locked.eq.true,lock_until.not.is.null))"}
+    groups = await get_all_groups(select, group_filters)
+    if groups is None:
+        return False
+    for group in groups:
+        scheduler.load(group)
+    print(f"🗓 {len(scheduler)} رویداد زمان‌بندی شد.")
+    return True
 
-async def unlock(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    admin_ids = [admin.user.id for admin in chat_admins]
 
-    if update.effective_user.id not in admin_ids:
+async def unlock(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(context.bot, update.effective_chat.id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند گروه را باز کنند.")
         return
 
@@ -617,157 +980,116 @@ async def unlock(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     )
 
+    audit.record(update.effective_chat.id, audit.UNLOCK, update.effective_user.id)
+
     # به‌روزرسانی وضعیت قفل‌شدن
-    update_lock_status(update.effective_chat.id, False, None)
+    if not await update_lock_status(update.effective_chat.id, False, None):
+        await update.message.reply_text("⚠️ گروه باز شد اما وضعیت آن ذخیره نشد.")
+    scheduler.cancel(update.effective_chat.id, UNLOCK)
     
     await update.message.reply_text("🔓 گروه باز شد.")
 
 
 
-async def check_and_apply_night_lock(bot: Bot):
+@metrics.timed(metrics.sweep_seconds, "night_start")
+async def check_and_apply_night_lock(bot: Bot, due_groups: list = None):
     now_utc = datetime.now(timezone.utc)
-    now_tehran = now_utc.astimezone(TEHRAN)
-    print(f"🕑 بررسی قفل شبانه - ساعت تهران: {now_tehran.strftime('%H:%M')}")
-    if not (now_tehran.hour == 2 and now_tehran.minute < 10):
-        return
-
-    url = f"{SUPABASE_URL}/rest/v1/groups?select=group_id,night_lock_active,night_lock_disabled_until,is_locked,last_night_lock_applied,lock_until"
-    response = requests.get(url, headers=headers)
-
-    if response.status_code != 200:
-        print("❌ خطا در واکشی گروه‌ها")
-        return
-
-    for group in response.json():
-        group_id = group["group_id"]
-        active = group.get("night_lock_active", False)
-        is_locked = group.get("is_locked", False)
-        disabled_until = group.get("night_lock_disabled_until")
-        last_applied = group.get("last_night_lock_applied")
-        lock_until = group.get("lock_until")  # بررسی قفل دستی
-
-        # اگر قفل شبانه غیرفعاله یا الان قفل شده (دستی یا شبانه)، رد کن
-        if not active or is_locked:
-            continue
-
-        # اگر قفل دستی فعاله، قفل شبانه اعمال نشه
-        if lock_until:
-            try:
-                lock_until_dt = datetime.fromisoformat(lock_until)
-                if datetime.utcnow() < lock_until_dt:
-                    continue
-            except:
-                pass
-
-        if disabled_until:
-            try:
-                disabled_dt = datetime.fromisoformat(disabled_until)
-                if now_utc < disabled_dt:
-                    continue
-            except:
-                pass
-
-        if last_applied:
-            try:
-                last_dt = datetime.fromisoformat(last_applied)
-                if last_dt.date() == now_tehran.date():
-                    continue
-            except:
-                pass
+    print("🌙 زمان اعمال قفل شبانه رسیده.")
+
+    # مقادیر داخل and/or باید در کوتیشن باشند (به‌خاطر : و . در زمان)
+    now = f'"{now_utc.isoformat()}"'
+    # اگر در ۱۲ ساعت گذشته انجام شده، تکرار نشود
+    recent_cutoff = f'"{(now_utc - timedelta(hours=12)).isoformat()}"'
+    # قفل شبانه فعال، گروه باز، بدون قفل دستی، غیرفعال‌سازی موقت تمام شده و اخیراً اعمال نشده
+    group_filters = {
+        "night_lock_active": "eq.true",
+        "is_locked": "eq.false",
+        "and": (
+            f"(or(lock_until.is.null,lock_until.lt.{now}),"
+            f"or(night_lock_disabled_until.is.null,night_lock_disabled_until.lt.{now}),"
+            f"or(last_night_lock_applied.is.null,last_night_lock_applied.lt.{recent_cutoff}))"
+        )
+    }
 
-        try:
-            await bot.set_chat_permissions(chat_id=group_id, permissions=ChatPermissions(can_send_messages=False))
-            await bot.send_message(chat_id=group_id, text="🌙 قفل شبانه برای امشب از ساعت 2 تا 7 فعال شد. شبتون زیبا")
-            update_lock_status(group_id, True)  # فقط پرچم is_locked
-            update_last_night_lock_applied(group_id)
-        except Exception as e:
-            print(f"❌ خطا در قفل گروه {group_id}: {e}")
+    async def apply(group_id):
+        start, end = scheduler.window(group_id)
+        await fanout.call(group_id, bot.set_chat_permissions, chat_id=group_id, permissions=ChatPermissions(can_send_messages=False))
+        audit.record(group_id, audit.NIGHT_LOCK_APPLY, start=start, end=end)
+        await fanout.call(group_id, bot.send_message, chat_id=group_id, text=f"🌙 قفل شبانه برای امشب از ساعت {start} تا {end} فعال شد. شبتون زیبا")
+        await update_night_lock_state(group_id, True)
+
+    results = await fanout.run(group_ids(iter_groups("group_id", group_filters, group_ids=due_groups)), apply)
+    fanout.summarize("قفل شبانه", results)
 
-async def check_and_release_night_lock(bot: Bot):
+@metrics.timed(metrics.sweep_seconds, "night_end")
+async def check_and_release_night_lock(bot: Bot, due_groups: list = None):
     now_utc = datetime.now(timezone.utc)
-    now_tehran = now_utc.astimezone(TEHRAN)
-    if not (now_tehran.hour == 7 and now_tehran.minute < 10):
-        print(f"⏰ زمان فعلی {now_tehran.strftime('%H:%M')}، هنوز زمان باز کردن نیست.")
-        return
     print("✅ زمان باز کردن گروه رسیده.")
 
-
-    url = f"{SUPABASE_URL}/rest/v1/groups?select=group_id,is_locked,last_night_lock_released,lock_until"
-    response = requests.get(url, headers=headers)
-
-    if response.status_code != 200:
-        return
-
-    for group in response.json():
-        group_id = group["group_id"]
-        is_locked = group.get("is_locked", False)
-        last_released = group.get("last_night_lock_released")
-        lock_until = group.get("lock_until")  # بررسی قفل دستی
-
-        # اگر قفل فعال نیست، بیخیال
-        if not is_locked:
-            continue
-
-        # اگر قفل دستی هنوز فعاله، نباید باز کنیم
-        if lock_until:
-            try:
-                lock_until_dt = datetime.fromisoformat(lock_until)
-                if datetime.utcnow() < lock_until_dt:
-                    continue
-            except:
-                pass
-
-        # اگر همین امروز باز شده بود قبلاً
-        if last_released:
-            try:
-                last_dt = datetime.fromisoformat(last_released)
-                if last_dt.date() == now_tehran.date():
-                    continue
-            except:
-                pass
-
-        try:
-            await bot.set_chat_permissions(
-                chat_id=group_id,
-                permissions=ChatPermissions(
-                    can_send_messages=True,
-                    can_send_audios=True,
-                    can_send_documents=True,
-                    can_send_photos=True,
-                    can_send_videos=True,
-                    can_send_video_notes=True,
-                    can_send_voice_notes=True,
-                    can_send_polls=True,
-                    can_send_other_messages=True,
-                    can_add_web_page_previews=True
-                )
+    now = f'"{now_utc.isoformat()}"'
+    # اگر در ۱۲ ساعت گذشته انجام شده، تکرار نشود
+    recent_cutoff = f'"{(now_utc - timedelta(hours=12)).isoformat()}"'
+    # گروه‌های قفل‌شده‌ای که قفل دستی فعال ندارند و اخیراً باز نشده‌اند
+    group_filters = {
+        "is_locked": "eq.true",
+        "and": (
+            f"(or(lock_until.is.null,lock_until.lt.{now}),"
+            f"or(last_night_lock_released.is.null,last_night_lock_released.lt.{recent_cutoff}))"
+        )
+    }
+
+    async def release(group_id):
+        await fanout.call(
+            group_id,
+            bot.set_chat_permissions,
+            chat_id=group_id,
+            permissions=ChatPermissions(
+                can_send_messages=True,
+                can_send_audios=True,
+                can_send_documents=True,
+                can_send_photos=True,
+                can_send_videos=True,
+                can_send_video_notes=True,
+                can_send_voice_notes=True,
+                can_send_polls=True,
+                can_send_other_messages=True,
+                can_add_web_page_previews=True
             )
-            await bot.send_message(chat_id=group_id, text="🔓 قفل شبانه به پایان رسید.")
-            update_lock_status(group_id, False, None)
-            update_last_night_lock_released(group_id)
-        except Exception as e:
-            print(f"❌ خطا در باز کردن گروه {group_id}: {e}")
+        )
+        audit.record(group_id, audit.NIGHT_LOCK_RELEASE)
+        await fanout.call(group_id, bot.send_message, chat_id=group_id, text="🔓 قفل شبانه به پایان رسید.")
+        await update_night_lock_state(group_id, False)
+
+    results = await fanout.run(group_ids(iter_groups("group_id", group_filters, group_ids=due_groups)), release)
+    fanout.summarize("پایان قفل شبانه", results)
 
 
 async def enable_night_lock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
 
     # بررسی اینکه فقط ادمین بتونه اجرا کنه
-    chat_admins = await context.bot.get_chat_administrators(chat_id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-    if update.effective_user.id not in admin_ids:
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند قفل شبانه را فعال کنند.")
         return
 
-    # فعال‌سازی در دیتابیس
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{chat_id}"
-    data = {"night_lock_active": True}
-    response = requests.patch(url, headers=headers, json=data)
+    # بازه اختیاری: /enablenightlock 23:30 06:00
+    start = end = None
+    if context.args:
+        try:
+            start, end = (parse_time(arg).strftime("%H:%M") for arg in context.args[:2])
+        except ValueError:
+            await update.message.reply_text("❌ فرمت بازه اشتباه است. مثال: /enablenightlock 23:30 06:00")
+            return
 
-    if response.status_code in [200, 204]:
-        await update.message.reply_text("✅ قفل شبانه در این کروه فعال شد.")
-    else:
+    # فعال‌سازی در دیتابیس
+    if not await update_night_lock(chat_id, active=True, start=start, end=end):
         await update.message.reply_text("❌ خطا در فعال‌سازی قفل شبانه.")
+        return
+
+    status = await get_night_lock_status(chat_id) or {}
+    scheduler.set_night_lock(chat_id, status.get("timezone"), status.get("night_lock_start"), status.get("night_lock_end"))
+    start, end = scheduler.window(chat_id)
+    await update.message.reply_text(f"✅ قفل شبانه در این کروه فعال شد (از ساعت {start} تا {end}).")
 
 
 async def disable_night_lock(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -775,19 +1097,16 @@ async def disable_night_lock(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = update.effective_user.id
 
     # بررسی اینکه کاربر ادمین هست یا نه
-    chat_admins = await context.bot.get_chat_administrators(chat_id)
-    admin_ids = [admin.user.id for admin in chat_admins]
-
-    if user_id not in admin_ids:
+    if not await is_admin(context.bot, chat_id, user_id):
         await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند قفل شبانه را غیرفعال کنند.")
         return
 
     # به‌روزرسانی در دیتابیس Supabase
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{chat_id}"
-    data = {"night_lock_active": False}
-    response = requests.patch(url, headers=headers, json=data)
-
-    if response.status_code in [200, 204]:
+    if await update_night_lock(chat_id, active=False):
+        scheduler.clear_night_lock(chat_id)
+        # رویداد پایان هم لغو شد و بعد از ری‌استارت هم بارگذاری نمی‌شود؛ قفل امشب همین حالا برداشته می‌شود
+        if await is_night_locked(chat_id):
+            await check_and_release_night_lock(context.bot, [chat_id])
         await update.message.reply_text("🌓 قفل شبانه برای این گروه *غیرفعال* شد.", parse_mode="Markdown")
     else:
         await update.message.reply_text("⚠️ خطایی در غیرفعال‌سازی قفل شبانه رخ داد. لطفاً دوباره تلاش کنید.")
@@ -796,17 +1115,39 @@ async def disable_night_lock(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def nightlock_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
 
-    url = f"{SUPABASE_URL}/rest/v1/groups?group_id=eq.{chat_id}&select=night_lock_active"
-    response = requests.get(url, headers=headers)
+    status = await get_night_lock_status(chat_id)
 
-    if response.status_code != 200 or not response.json():
+    if not status:
         await update.message.reply_text("❌ خطا در دریافت وضعیت قفل شبانه.")
         return
 
-    active = response.json()[0].get("night_lock_active", False)
+    active = status.get("night_lock_active", False)
 
     if active:
-        await update.message.reply_text("🌙 قفل شبانه فعال است.")
+        start, end = scheduler.window(chat_id)
+        await update.message.reply_text(f"🌙 قفل شبانه فعال است (از ساعت {start} تا {end} به وقت {status.get('timezone')}).")
     else:
         await update.message.reply_text("🌙 قفل شبانه **غیرفعال** است.")
 
+
+# تنظیم منطقه زمانی گروه برای قفل شبانه
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+
+    if not await is_admin(context.bot, chat_id, update.effective_user.id):
+        await update.message.reply_text("❌ فقط ادمین‌ها می‌توانند منطقه زمانی را تغییر دهند.")
+        return
+
+    if not context.args or not get_zone(context.args[0]):
+        await update.message.reply_text("❌ منطقه زمانی نامعتبر است. مثال: /settimezone Asia/Tehran")
+        return
+
+    tz_name = context.args[0]
+    if not await update_night_lock(chat_id, timezone_name=tz_name):
+        await update.message.reply_text("⚠️ خطا در ذخیره منطقه زمانی.")
+        return
+
+    status = await get_night_lock_status(chat_id) or {}
+    if status.get("night_lock_active"):
+        scheduler.set_night_lock(chat_id, tz_name, status.get("night_lock_start"), status.get("night_lock_end"))
+    await update.message.reply_text(f"🕰 منطقه زمانی گروه روی {tz_name} تنظیم شد.")
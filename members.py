@@ -0,0 +1,109 @@
+from collections import OrderedDict
+
+from telegram import MessageEntity, Update, User
+from telegram.ext import ContextTypes
+
+from config import MEMBER_INDEX_SIZE
+from local_store import store
+
+
+# یوزرنیم و نام کاربرانی که در هر گروه دیده شده‌اند؛ Bot API جستجو با یوزرنیم ندارد.
+# قدیمی‌ترین‌ها (LRU) کنار گذاشته می‌شوند و اگر نسخه محلی فعال باشد از آنجا برمی‌گردند
+class MemberIndex:
+    def __init__(self, max_entries: int = MEMBER_INDEX_SIZE):
+        self.max_entries = max_entries
+        # (chat_id, user_id) -> (username, name, is_bot)
+        self._users = OrderedDict()
+        # (chat_id, username با حروف کوچک) -> user_id
+        self._usernames = {}
+
+    def remember(self, chat_id: int, user: User):
+        key = (chat_id, user.id)
+        entry = (user.username, user.full_name, user.is_bot)
+        old = self._users.get(key)
+        if old == entry:
+            # حالت رایج: کاربر تغییری نکرده و چیزی نوشته نمی‌شود
+            self._users.move_to_end(key)
+            return
+
+        self._set(chat_id, user.id, entry, old)
+        if store:
+            store.put_member(chat_id, user.id, *entry)
+
+    def get(self, chat_id: int, user_id: int):
+        entry = self._users.get((chat_id, user_id))
+        if entry is None and store:
+            row = store.get_member(chat_id, user_id)
+            if row:
+                entry = self._load(chat_id, row)
+        return _user(user_id, entry) if entry else None
+
+    def find(self, chat_id: int, username: str):
+        username = username.lstrip("@")
+        user_id = self._usernames.get((chat_id, username.lower()))
+        if user_id is not None:
+            return self.get(chat_id, user_id)
+        if store:
+            row = store.find_member(chat_id, username)
+            if row:
+                return _user(row[0], self._load(chat_id, row))
+        return None
+
+    def _load(self, chat_id: int, row) -> tuple:
+        user_id, username, name, is_bot = row
+        entry = (username, name, bool(is_bot))
+        self._set(chat_id, user_id, entry, self._users.get((chat_id, user_id)))
+        return entry
+
+    def _set(self, chat_id: int, user_id: int, entry: tuple, old):
+        if old and old[0]:
+            self._drop_username(chat_id, old[0], user_id)
+        self._users[(chat_id, user_id)] = entry
+        self._users.move_to_end((chat_id, user_id))
+        if entry[0]:
+            self._usernames[(chat_id, entry[0].lower())] = user_id
+
+        while len(self._users) > self.max_entries:
+            (old_chat, old_user), (username, _, _) = self._users.popitem(last=False)
+            if username:
+                self._drop_username(old_chat, username, old_user)
+
+    def _drop_username(self, chat_id: int, username: str, user_id: int):
+        # فقط اگر یوزرنیم هنوز مال همین کاربر باشد
+        key = (chat_id, username.lower())
+        if self._usernames.get(key) == user_id:
+            del self._usernames[key]
+
+    def __len__(self):
+        return len(self._users)
+
+
+def _user(user_id: int, entry: tuple) -> User:
+    username, name, is_bot = entry
+    return User(id=user_id, first_name=name, is_bot=is_bot, username=username)
+
+
+index = MemberIndex()
+
+
+# همه کاربرانی که در یک آپدیت گروهی دیده می‌شوند ثبت می‌شوند؛ قبل از همه هندلرها اجرا می‌شود
+async def track_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+    if not chat or chat.type not in ("group", "supergroup"):
+        return
+
+    if update.effective_user:
+        index.remember(chat.id, update.effective_user)
+
+    message = update.effective_message
+    if message:
+        if message.reply_to_message and message.reply_to_message.from_user:
+            index.remember(chat.id, message.reply_to_message.from_user)
+        for member in message.new_chat_members or ():
+            index.remember(chat.id, member)
+        for entity in message.entities or ():
+            if entity.type == MessageEntity.TEXT_MENTION and entity.user:
+                index.remember(chat.id, entity.user)
+
+    if update.chat_member:
+        index.remember(chat.id, update.chat_member.new_chat_member.user)
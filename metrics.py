@@ -0,0 +1,164 @@
+import time
+from bisect import bisect_left
+from functools import wraps
+
+import httpx
+from telegram.ext import ApplicationHandlerStop
+from telegram.request import HTTPXRequest
+
+# متریک‌های درون‌حافظه‌ای با خروجی متنی Prometheus؛ هر ثبت فقط یک جستجوی دیکشنری و چند جمع است
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+INF = 'le="+Inf"'
+
+_metrics = []
+_gauges = []  # (name, help, تابع مقدار)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [شمارش هر bucket (غیرتجمعی)، مجموع، تعداد]
+        self._values = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%g"' % bound
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.label_names, labels, INF)} {count}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total:g}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+def gauge(name: str, help_text: str, value_fn):
+    # مقدار در لحظه خواندن /metrics محاسبه می‌شود
+    _gauges.append((name, help_text, value_fn))
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, help_text, value_fn in _gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value_fn():g}")
+    return "\n".join(lines) + "\n"
+
+
+handler_seconds = Histogram("bot_handler_seconds", "Telegram handler latency", ("handler",))
+handler_errors = Counter("bot_handler_errors_total", "Telegram handler exceptions", ("handler",))
+stage_seconds = Histogram("bot_pipeline_stage_seconds", "Message pipeline stage latency", ("stage",))
+supabase_seconds = Histogram("supabase_request_seconds", "Supabase request latency", ("table", "method"))
+supabase_errors = Counter("supabase_errors_total", "Supabase failed requests", ("table", "method"))
+bot_api_seconds = Histogram("bot_api_request_seconds", "Bot API request latency", ("method",))
+bot_api_errors = Counter("bot_api_errors_total", "Bot API failed requests", ("method",))
+sweep_seconds = Histogram("sweep_seconds", "Scheduled sweep duration", ("sweep",))
+
+
+def timed(histogram: Histogram, name: str, errors: Counter = None):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except ApplicationHandlerStop:
+                raise
+            except Exception:
+                if errors is not None:
+                    errors.inc(name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
+
+def instrument_handlers(application):
+    # همه هندلرهای ثبت‌شده با نام تابعشان اندازه‌گیری می‌شوند
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            name = getattr(handler.callback, "__name__", type(handler).__name__)
+            handler.callback = timed(handler_seconds, name, handler_errors)(handler.callback)
+
+
+# اتصال‌های Supabase؛ جدول از مسیر /rest/v1/<table> خوانده می‌شود
+class SupabaseTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        table = request.url.path.split("/rest/v1/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            supabase_errors.inc(table, request.method)
+            raise
+        finally:
+            supabase_seconds.observe(time.perf_counter() - started, table, request.method)
+        if response.status_code >= 400:
+            supabase_errors.inc(table, request.method)
+        return response
+
+
+# درخواست‌های Bot API؛ نام متد آخرین بخش آدرس است
+class BotAPIRequest(HTTPXRequest):
+    async def do_request(self, url: str, *args, **kwargs):
+        method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, *args, **kwargs)
+        except Exception:
+            bot_api_errors.inc(method)
+            raise
+        finally:
+            bot_api_seconds.observe(time.perf_counter() - started, method)
+        if code >= 400:
+            bot_api_errors.inc(method)
+        return code, payload
@@ -0,0 +1,3 @@
+-- دامنه‌هایی که ارسال لینکشان در گروه آزاد است
+alter table groups
+    add column if not exists allowed_domains text[] not null default '{}';
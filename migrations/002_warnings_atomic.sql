@@ -0,0 +1,46 @@
+-- ادغام ردیف‌های تکراری قبل از اضافه کردن کلید یکتا (بیشترین تعداد اخطار نگه داشته می‌شود)
+delete from warnings w
+using (
+    select ctid, row_number() over (
+        partition by group_id, user_id
+        order by count desc, last_warning desc
+    ) as rn
+    from warnings
+) d
+where w.ctid = d.ctid and d.rn > 1;
+
+alter table warnings
+    add constraint warnings_group_user_key unique (group_id, user_id);
+
+-- افزایش یا کاهش اتمیک اخطار در یک رفت‌وبرگشت؛ تعداد جدید را برمی‌گرداند
+create or replace function change_warning(
+    p_group_id bigint,
+    p_user_id bigint,
+    p_username text,
+    p_delta integer
+)
+returns integer
+language plpgsql
+as $$
+declare
+    new_count integer;
+begin
+    if p_delta >= 0 then
+        insert into warnings as w (group_id, user_id, username, count, last_warning)
+        values (p_group_id, p_user_id, p_username, p_delta, now())
+        on conflict (group_id, user_id) do update
+            set count = w.count + excluded.count,
+                username = coalesce(excluded.username, w.username),
+                last_warning = excluded.last_warning
+        returning w.count into new_count;
+    else
+        update warnings
+            set count = greatest(count + p_delta, 0),
+                last_warning = now()
+        where group_id = p_group_id and user_id = p_user_id
+        returning count into new_count;
+    end if;
+
+    return coalesce(new_count, 0);
+end;
+$$;
@@ -0,0 +1,11 @@
+-- ایندکس‌های جزئی برای بررسی‌های دوره‌ای تا فقط ردیف‌های نیازمند اقدام خوانده شوند
+
+-- قفل‌های زمان‌دار و آزادسازی صبحگاهی (is_locked=eq.true&lock_until=lt...)
+create index if not exists groups_locked_idx
+    on groups (group_id, lock_until)
+    where is_locked;
+
+-- هشدار و اعمال قفل شبانه (night_lock_active=eq.true)
+create index if not exists groups_night_lock_idx
+    on groups (group_id)
+    where night_lock_active;
@@ -0,0 +1,10 @@
+-- بازه و منطقه زمانی قفل شبانه برای هر گروه
+alter table groups
+    add column if not exists timezone text not null default 'Asia/Tehran',
+    add column if not exists night_lock_start time not null default '02:00',
+    add column if not exists night_lock_end time not null default '07:00';
+
+-- بارگذاری زمان‌بندی در شروع برنامه
+create index if not exists groups_lock_until_idx
+    on groups (group_id)
+    where is_locked and lock_until is not null;
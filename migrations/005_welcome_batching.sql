@@ -0,0 +1,4 @@
+-- تنظیمات تجمیع پیام خوش‌آمد برای هر گروه (null یعنی مقدار پیش‌فرض)
+alter table groups
+    add column if not exists welcome_window real,
+    add column if not exists welcome_batch integer;
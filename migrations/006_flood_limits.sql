@@ -0,0 +1,4 @@
+-- آستانه ضد اسپم هر گروه (null یعنی مقدار پیش‌فرض، flood_limit = 0 یعنی غیرفعال)
+alter table groups
+    add column if not exists flood_limit integer,
+    add column if not exists flood_window real;
@@ -0,0 +1,11 @@
+-- قوانین هر گروه: پاسخ خودکار به کلمه (reply)، پاسخ با regex (regex) و کلمات ممنوع (banned)
+create table if not exists group_rules (
+    id bigserial primary key,
+    group_id bigint not null,
+    kind text not null check (kind in ('reply', 'regex', 'banned')),
+    pattern text not null,
+    response text,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists group_rules_group_idx on group_rules (group_id, id);
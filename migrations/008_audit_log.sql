@@ -0,0 +1,29 @@
+-- گزارش اقدامات مدیریتی (اخطار، سکوت، بن، قفل، حذف خودکار پیام‌ها و ...)؛ فقط اضافه می‌شود
+create table if not exists audit_log (
+    id bigserial primary key,
+    event_id uuid not null unique,  -- ارسال دوباره یک دسته ردیف تکراری نمی‌سازد
+    group_id bigint not null,
+    action text not null,
+    actor_id bigint,                -- null یعنی اقدام خودکار ربات
+    target_id bigint,
+    details jsonb,
+    created_at timestamptz not null default now()
+);
+
+-- خروجی هر گروه به ترتیب id (group_id=eq...&id=gt.<cursor>&order=id.asc)
+create index if not exists audit_log_group_idx on audit_log (group_id, id);
+
+-- ویرایش و حذف ردیف‌ها ممنوع است
+create or replace function audit_log_append_only()
+returns trigger
+language plpgsql
+as $$
+begin
+    raise exception 'audit_log is append-only';
+end;
+$$;
+
+drop trigger if exists audit_log_append_only on audit_log;
+create trigger audit_log_append_only
+    before update or delete on audit_log
+    for each row execute function audit_log_append_only();
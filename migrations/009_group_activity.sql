@@ -0,0 +1,58 @@
+-- آمار ساعتی فعالیت هر گروه (rollup)؛ ربات شمارش‌ها را در حافظه جمع می‌کند و هر چند دقیقه ادغام می‌کند
+create table if not exists group_activity_hourly (
+    group_id bigint not null,
+    hour timestamptz not null,
+    messages integer not null default 0,
+    users jsonb not null default '{}',  -- رجیسترهای غیر صفر HyperLogLog: {"index": rank}
+    top jsonb not null default '{}',    -- پرکارترین کاربران: {"user_id": count}
+    primary key (group_id, hour)
+);
+
+-- ادغام تغییرهای چند گروه-ساعت در یک رفت‌وبرگشت: پیام‌ها جمع، رجیسترها max و شمارش کاربران جمع می‌شوند
+create or replace function merge_group_activity(p_rows jsonb)
+returns void
+language plpgsql
+as $$
+declare
+    r jsonb;
+begin
+    for r in select * from jsonb_array_elements(p_rows) loop
+        insert into group_activity_hourly as a (group_id, hour, messages, users, top)
+        values (
+            (r->>'group_id')::bigint,
+            (r->>'hour')::timestamptz,
+            (r->>'messages')::integer,
+            coalesce(r->'users', '{}'),
+            coalesce(r->'top', '{}')
+        )
+        on conflict (group_id, hour) do update
+            set messages = a.messages + excluded.messages,
+                users = (
+                    select coalesce(jsonb_object_agg(key, rank), '{}')
+                    from (
+                        select key, max(value::integer) as rank
+                        from (
+                            select * from jsonb_each_text(a.users)
+                            union all
+                            select * from jsonb_each_text(excluded.users)
+                        ) u
+                        group by key
+                    ) m
+                ),
+                top = (
+                    select coalesce(jsonb_object_agg(key, total), '{}')
+                    from (
+                        select key, sum(value::integer) as total
+                        from (
+                            select * from jsonb_each_text(a.top)
+                            union all
+                            select * from jsonb_each_text(excluded.top)
+                        ) t
+                        group by key
+                        order by total desc
+                        limit 64
+                    ) m
+                );
+    end loop;
+end;
+$$;
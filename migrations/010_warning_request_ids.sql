@@ -0,0 +1,60 @@
+-- شناسه تغییرهای اخطار که از ژورنال نسخه محلی ارسال شده‌اند؛ اگر پاسخ گم شود و همان تغییر دوباره
+-- ارسال شود، بار دوم اعمال نمی‌شود
+create table if not exists warning_requests (
+    request_id uuid primary key,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists warning_requests_created_idx on warning_requests (created_at);
+
+-- همان تابع migrations/002 با پارامتر اختیاری p_request_id؛ فراخوانی بدون آن مثل قبل کار می‌کند
+drop function if exists change_warning(bigint, bigint, text, integer);
+
+create or replace function change_warning(
+    p_group_id bigint,
+    p_user_id bigint,
+    p_username text,
+    p_delta integer,
+    p_request_id uuid default null
+)
+returns integer
+language plpgsql
+as $$
+declare
+    new_count integer;
+begin
+    if p_request_id is not null then
+        insert into warning_requests (request_id) values (p_request_id)
+        on conflict (request_id) do nothing;
+        if not found then
+            -- تکراری: فقط تعداد فعلی برگردانده می‌شود
+            select count into new_count from warnings
+            where group_id = p_group_id and user_id = p_user_id;
+            return coalesce(new_count, 0);
+        end if;
+
+        -- شناسه‌های قدیمی گاهی پاک می‌شوند؛ ژورنال تلاش دوباره را حداکثر چند دقیقه عقب می‌اندازد
+        if random() < 0.01 then
+            delete from warning_requests where created_at < now() - interval '7 days';
+        end if;
+    end if;
+
+    if p_delta >= 0 then
+        insert into warnings as w (group_id, user_id, username, count, last_warning)
+        values (p_group_id, p_user_id, p_username, p_delta, now())
+        on conflict (group_id, user_id) do update
+            set count = w.count + excluded.count,
+                username = coalesce(excluded.username, w.username),
+                last_warning = excluded.last_warning
+        returning w.count into new_count;
+    else
+        update warnings
+            set count = greatest(count + p_delta, 0),
+                last_warning = now()
+        where group_id = p_group_id and user_id = p_user_id
+        returning count into new_count;
+    end if;
+
+    return coalesce(new_count, 0);
+end;
+$$;
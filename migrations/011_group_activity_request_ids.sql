@@ -0,0 +1,71 @@
+-- شناسه دسته‌های آمار ارسال‌شده؛ ادغام جمع‌پذیر است و اگر پاسخ گم شود ارسال دوباره همان دسته
+-- نباید پیام‌ها و پرکارترین‌ها را دو بار بشمارد (مثل warning_requests در migrations/010)
+create table if not exists group_activity_requests (
+    request_id uuid primary key,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists group_activity_requests_created_idx on group_activity_requests (created_at);
+
+-- همان تابع migrations/009 با پارامتر اختیاری p_request_id
+drop function if exists merge_group_activity(jsonb);
+
+create or replace function merge_group_activity(p_rows jsonb, p_request_id uuid default null)
+returns void
+language plpgsql
+as $$
+declare
+    r jsonb;
+begin
+    if p_request_id is not null then
+        insert into group_activity_requests (request_id) values (p_request_id)
+        on conflict (request_id) do nothing;
+        if not found then
+            return;  -- این دسته قبلاً ادغام شده است
+        end if;
+
+        if random() < 0.01 then
+            delete from group_activity_requests where created_at < now() - interval '7 days';
+        end if;
+    end if;
+
+    for r in select * from jsonb_array_elements(p_rows) loop
+        insert into group_activity_hourly as a (group_id, hour, messages, users, top)
+        values (
+            (r->>'group_id')::bigint,
+            (r->>'hour')::timestamptz,
+            (r->>'messages')::integer,
+            coalesce(r->'users', '{}'),
+            coalesce(r->'top', '{}')
+        )
+        on conflict (group_id, hour) do update
+            set messages = a.messages + excluded.messages,
+                users = (
+                    select coalesce(jsonb_object_agg(key, rank), '{}')
+                    from (
+                        select key, max(value::integer) as rank
+                        from (
+                            select * from jsonb_each_text(a.users)
+                            union all
+                            select * from jsonb_each_text(excluded.users)
+                        ) u
+                        group by key
+                    ) m
+                ),
+                top = (
+                    select coalesce(jsonb_object_agg(key, total), '{}')
+                    from (
+                        select key, sum(value::integer) as total
+                        from (
+                            select * from jsonb_each_text(a.top)
+                            union all
+                            select * from jsonb_each_text(excluded.top)
+                        ) t
+                        group by key
+                        order by total desc
+                        limit 64
+                    ) m
+                );
+    end loop;
+end;
+$$;
@@ -0,0 +1,203 @@
+import time
+from datetime import datetime, timedelta
+
+from telegram import Update, ChatPermissions
+from telegram.ext import ContextTypes, ApplicationHandlerStop
+
+import audit
+import flood
+import metrics
+import recent
+import rules
+import spam
+import stats
+from admins import is_admin
+from config import FLOOD_LIMIT, FLOOD_WINDOW, FLOOD_MUTE_SECONDS
+from database import get_group, add_warning
+from links import extract_links, is_forbidden
+
+# نتیجه هر مرحله
+CONTINUE = 0
+STOP = 1  # اقدام مدیریتی انجام شد یا پیام نیازی به ادامه ندارد
+
+
+# نمای مشترک یک پیام؛ هر چیز فقط یک بار و فقط در صورت نیاز محاسبه می‌شود
+class MessageView:
+    __slots__ = ("message", "bot", "chat_id", "user", "is_group", "text", "is_command",
+                 "_normalized", "_links", "_group", "_is_admin", "rule")
+
+    def __init__(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self.message = update.message
+        self.bot = context.bot
+        self.chat_id = update.effective_chat.id
+        self.user = self.message.from_user
+        self.is_group = update.effective_chat.type in ("group", "supergroup")
+        self.text = self.message.text or ""
+        self.is_command = self.text.startswith("/")
+        self._normalized = None
+        self._links = None
+        self._group = None
+        self._is_admin = None
+        self.rule = None
+
+    @property
+    def normalized(self) -> str:
+        if self._normalized is None:
+            self._normalized = self.text.lower().strip()
+        return self._normalized
+
+    @property
+    def links(self):
+        if self._links is None:
+            self._links = extract_links(self.message)
+        return self._links
+
+    async def group(self) -> dict:
+        if self._group is None:
+            self._group = await get_group(self.chat_id) or {}
+        return self._group
+
+    async def sender_is_admin(self) -> bool:
+        # وضعیت فرستنده برای همه مراحل فقط یک بار بررسی می‌شود
+        if self._is_admin is None:
+            self._is_admin = await is_admin(self.bot, self.chat_id, self.user.id)
+        return self._is_admin
+
+
+# ضد اسپم: ساکت کردن خودکار کاربری که پشت سر هم پیام می‌فرستد
+async def flood_stage(view: MessageView) -> int:
+    if not view.is_group:
+        return CONTINUE
+
+    group = await view.group()
+    limit = group.get("flood_limit")
+    limit = FLOOD_LIMIT if limit is None else limit
+    if limit <= 0:
+        return CONTINUE  # ضد اسپم در این گروه غیرفعال است
+    window = group.get("flood_window") or FLOOD_WINDOW
+
+    result = flood.limiter.hit(view.chat_id, view.user.id, limit, window)
+    if result == flood.OK:
+        return CONTINUE
+    if result == flood.MUTED:
+        raise ApplicationHandlerStop
+
+    if await view.sender_is_admin():
+        return CONTINUE
+
+    flood.limiter.mute(view.chat_id, view.user.id, FLOOD_MUTE_SECONDS)
+    audit.record(view.chat_id, audit.FLOOD_MUTE, None, view.user.id, seconds=FLOOD_MUTE_SECONDS)
+    try:
+        await view.bot.restrict_chat_member(
+            view.chat_id,
+            view.user.id,
+            permissions=ChatPermissions(can_send_messages=False),
+            until_date=datetime.utcnow() + timedelta(seconds=FLOOD_MUTE_SECONDS)
+        )
+        await view.message.reply_text(
+            f"🔇 کاربر {view.user.mention_html()} به دلیل ارسال پیام‌های پشت سر هم برای {FLOOD_MUTE_SECONDS // 60} دقیقه ساکت شد.",
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        print(f"❌ خطا در ساکت کردن خودکار کاربر {view.user.id} در گروه {view.chat_id}: {e}")
+    # دستورات این پیام هم اجرا نشوند
+    raise ApplicationHandlerStop
+
+
+# متنی که همین حالا در چند گروه دیگر هم فرستاده شده (اسپم سراسری)
+async def spam_stage(view: MessageView) -> int:
+    if not view.is_group or not spam.index.add(view.chat_id, view.text):
+        return CONTINUE
+
+    if await view.sender_is_admin():
+        return CONTINUE
+
+    await delete_and_warn(view, audit.SPAM_DELETED, f"❌ پیام {view.user.mention_html()} به دلیل ارسال متن تکراری در چند گروه حذف شد.")
+    return STOP
+
+
+# حذف لینک
+async def link_stage(view: MessageView) -> int:
+    # بدون هیچ درخواست شبکه‌ای برای پیام‌های بدون لینک
+    hosts, obfuscated = view.links
+    if not hosts and not obfuscated:
+        return CONTINUE
+
+    if await view.sender_is_admin():
+        return CONTINUE
+
+    if not await is_forbidden(view.chat_id, hosts, obfuscated):
+        return CONTINUE
+
+    await delete_and_warn(view, audit.LINK_DELETED, "❌ ارسال لینک بدون هماهنگی با ادمین ممنوع است.", hosts=hosts)
+    return STOP
+
+
+# همه قوانین گروه (پاسخ خودکار، کلمات ممنوع، regex) با یک الگوی ترکیبی بررسی می‌شوند
+async def keyword_stage(view: MessageView) -> int:
+    matcher = await rules.get_matcher(view.chat_id)
+    view.rule = matcher.match(view.normalized)
+    if not view.rule or view.rule["kind"] != rules.BANNED:
+        return CONTINUE
+
+    if await view.sender_is_admin():
+        view.rule = None
+        return CONTINUE
+
+    await delete_and_warn(view, audit.BANNED_WORD_DELETED, f"❌ پیام {view.user.mention_html()} به دلیل داشتن کلمه ممنوع حذف شد.", rule_id=view.rule.get("id"))
+    return STOP
+
+
+async def auto_reply_stage(view: MessageView) -> int:
+    if view.rule:
+        await view.message.reply_text(rules.render(view.rule, view.user.first_name))
+    return CONTINUE
+
+
+async def delete_and_warn(view: MessageView, action: str, reason: str, **details):
+    try:
+        await view.message.delete()
+        recent.messages.discard(view.chat_id, (view.message.message_id,))
+    except Exception as e:
+        print(f"❌ خطا در حذف پیام {view.message.message_id} در گروه {view.chat_id}: {e}")
+    count = await add_warning(view.chat_id, view.user.id, view.user.username or "بدون‌نام")
+    audit.record(view.chat_id, action, None, view.user.id, count=count, **details)
+    warning = f"⚠️ اخطار شماره {count} ثبت شد." if count is not None else "⚠️ ثبت اخطار فعلاً ممکن نشد."
+    # پیام اصلی حذف شده؛ پاسخ به آن ممکن نیست
+    await view.bot.send_message(
+        chat_id=view.chat_id,
+        text=f"{reason}\n{warning}",
+        parse_mode='HTML'
+    )
+
+
+# مراحل به ترتیب اجرا می‌شوند؛ ضد اسپم برای همه پیام‌ها و بقیه فقط برای متن‌های غیر دستوری.
+# اثر متن قبل از هر مرحله دیگری ثبت می‌شود تا نسخه‌هایی که مراحل بعدی حذف می‌کنند هم شمرده شوند
+STAGES = [flood_stage]
+TEXT_STAGES = [spam_stage, link_stage, keyword_stage, auto_reply_stage]
+
+
+async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message or not update.message.from_user:
+        return
+
+    view = MessageView(update, context)
+    if view.is_group:
+        recent.messages.record(view.chat_id, view.message.message_id, view.user.id)
+        stats.record(view.chat_id, view.user.id)
+    if await _run(STAGES, view) == STOP:
+        return
+    if view.text and not view.is_command:
+        await _run(TEXT_STAGES, view)
+
+
+async def _run(stages, view: MessageView) -> int:
+    for stage in stages:
+        started = time.perf_counter()
+        try:
+            result = await stage(view)
+        finally:
+            metrics.stage_seconds.observe(time.perf_counter() - started, stage.__name__)
+        if result == STOP:
+            return STOP
+    return CONTINUE
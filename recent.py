@@ -0,0 +1,91 @@
+from array import array
+from collections import OrderedDict
+
+import fanout
+from config import RECENT_MESSAGES, RECENT_CHATS
+
+# حداکثر شناسه در هر فراخوانی deleteMessages
+DELETE_BATCH = 100
+
+
+# آخرین پیام‌های هر چت (message_id و user_id) در دو آرایه حلقوی فشرده؛
+# چت‌هایی که مدتی پیامی نداشته‌اند به ترتیب LRU کنار گذاشته می‌شوند
+class RecentMessages:
+    def __init__(self, size: int = RECENT_MESSAGES, max_chats: int = RECENT_CHATS):
+        self.size = size
+        self.max_chats = max_chats
+        # chat_id -> [message_ids, user_ids, خانه بعدی]
+        self._chats = OrderedDict()
+
+    def record(self, chat_id: int, message_id: int, user_id: int):
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [array("q"), array("q"), 0]
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+
+        message_ids, user_ids, position = entry
+        # تا پر شدن بافر فقط اضافه می‌شود تا چت‌های کم‌پیام حافظه کمتری بگیرند
+        if len(message_ids) < self.size:
+            message_ids.append(message_id)
+            user_ids.append(user_id)
+        else:
+            message_ids[position] = message_id
+            user_ids[position] = user_id
+        entry[2] = (position + 1) % self.size
+
+    def _newest_first(self, chat_id: int):
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return
+        message_ids, user_ids, position = entry
+        count = len(message_ids)
+        # تا پر شدن بافر position همان count است
+        for i in range(1, count + 1):
+            index = (position - i) % count
+            if message_ids[index]:
+                yield message_ids[index], user_ids[index]
+
+    def latest(self, chat_id: int, n: int) -> list:
+        result = []
+        for message_id, _ in self._newest_first(chat_id):
+            if len(result) >= n:
+                break
+            result.append(message_id)
+        return result
+
+    def from_user(self, chat_id: int, user_id: int) -> list:
+        return [message_id for message_id, sender in self._newest_first(chat_id) if sender == user_id]
+
+    def discard(self, chat_id: int, message_ids):
+        # پیام‌های حذف‌شده صفر می‌شوند تا در purge بعدی شمرده نشوند
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return
+        removed = set(message_ids)
+        buffer = entry[0]
+        for index, message_id in enumerate(buffer):
+            if message_id in removed:
+                buffer[index] = 0
+
+    def __len__(self):
+        return len(self._chats)
+
+
+messages = RecentMessages()
+
+
+async def delete_messages(bot, chat_id: int, message_ids: list) -> int:
+    # حذف گروهی با deleteMessages (هر فراخوانی تا ۱۰۰ پیام)؛ تعداد پیام‌های دسته‌های موفق برگردانده می‌شود
+    deleted = 0
+    for start in range(0, len(message_ids), DELETE_BATCH):
+        batch = message_ids[start:start + DELETE_BATCH]
+        try:
+            await fanout.call(chat_id, bot.delete_messages, chat_id=chat_id, message_ids=batch)
+            deleted += len(batch)
+        except Exception as e:
+            print(f"❌ خطا در حذف گروهی {len(batch)} پیام در گروه {chat_id}: {e}")
+        messages.discard(chat_id, batch)
+    return deleted
@@ -0,0 +1,146 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+from config import (
+    SUPABASE_RETRIES, SUPABASE_RETRY_BUDGET, SUPABASE_CALL_DEADLINE,
+    SUPABASE_BREAKER_FAILURES, SUPABASE_BREAKER_RESET
+)
+from metrics import SupabaseTransport
+
+# فقط درخواست‌هایی که تکرارشان نتیجه را عوض نمی‌کند دوباره ارسال می‌شوند
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PATCH", "DELETE")
+RETRY_STATUSES = (429, 502, 503, 504)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    pass
+
+
+# بعد از چند خطای پشت سر هم، درخواست‌ها تا مدتی بدون انتظار رد می‌شوند؛
+# سپس یک درخواست آزمایشی اجازه دارد و موفقیت آن مدار را می‌بندد
+class CircuitBreaker:
+    def __init__(self, failures: int = SUPABASE_BREAKER_FAILURES, reset_after: float = SUPABASE_BREAKER_RESET):
+        self.failure_threshold = failures
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        # اگر درخواست آزمایشی لغو شده باشد، بعد از همین مدت آزمایش دیگری مجاز است
+        now = time.monotonic()
+        if now - self._opened_at >= self.reset_after:
+            self.state = HALF_OPEN
+            self._opened_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                print(f"🔌 مدار Supabase باز شد ({self.failures} خطا)")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+
+# سقف تلاش‌های دوباره به نسبت درخواست‌ها تا در زمان قطعی، تکرارها بار را چند برابر نکنند
+class RetryBudget:
+    def __init__(self, ratio: float = SUPABASE_RETRY_BUDGET, min_per_second: float = 1, max_tokens: float = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def deposit(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_tokens,
+            self._tokens + self.ratio + (now - self._updated) * self.min_per_second
+        )
+        self._updated = now
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+breakers = {}  # endpoint -> CircuitBreaker
+budget = RetryBudget()
+
+
+def breaker_states():
+    return {endpoint: breaker.state for endpoint, breaker in breakers.items()}
+
+
+# هر endpoint (جدول یا rpc) مدار خودش را دارد؛ هر تلاش جداگانه در متریک‌ها ثبت می‌شود
+class ResilientTransport(SupabaseTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.split("/rest/v1/", 1)[-1]
+        breaker = breakers.get(endpoint)
+        if breaker is None:
+            breaker = breakers[endpoint] = CircuitBreaker()
+
+        deadline = time.monotonic() + SUPABASE_CALL_DEADLINE
+        retries = SUPABASE_RETRIES if request.method in IDEMPOTENT_METHODS else 0
+        budget.deposit()
+
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"circuit open for {endpoint}", request=request)
+
+            try:
+                # هر تلاش فقط تا پایان مهلت کل فراخوانی فرصت دارد، نه یک SUPABASE_TIMEOUT کامل
+                response = await asyncio.wait_for(self._attempt(request), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                raise DeadlineExceeded(f"call deadline ({SUPABASE_CALL_DEADLINE}s) exceeded for {endpoint}", request=request)
+            except httpx.TransportError:
+                breaker.record_failure()
+                if not self._can_retry(attempt, retries, deadline):
+                    raise
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if response.status_code not in RETRY_STATUSES or not self._can_retry(attempt, retries, deadline):
+                    return response
+                await response.aclose()
+
+            # backoff نمایی با jitter کامل
+            await asyncio.sleep(random.uniform(0, max(0.0, min(deadline - time.monotonic(), 0.1 * 2 ** attempt))))
+
+    async def _attempt(self, request: httpx.Request) -> httpx.Response:
+        response = await super().handle_async_request(request)
+        try:
+            # بدنه هم داخل مهلت خوانده می‌شود؛ کلاینت بعداً نسخه خوانده‌شده را برمی‌دارد
+            await response.aread()
+        except BaseException:
+            await response.aclose()
+            raise
+        return response
+
+    @staticmethod
+    def _can_retry(attempt: int, retries: int, deadline: float) -> bool:
+        return attempt < retries and time.monotonic() < deadline and budget.withdraw()
@@ -0,0 +1,204 @@
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # پایتون قدیمی‌تر از 3.11
+    import sre_parse
+
+from cache import TTLCache
+from config import RULE_CACHE_TTL, RULE_CACHE_SIZE
+from database import get_group_rules
+
+BOT_NAME = "ربات"
+
+# انواع قوانین
+REPLY = "reply"     # پاسخ به کلمه یا عبارت
+REGEX = "regex"     # پاسخ به الگوی regex
+BANNED = "banned"   # کلمه ممنوع (حذف پیام و اخطار)
+
+MAX_PATTERN_LENGTH = 200
+# سقف هزینه تخمینی بررسی یک الگو (حدود ۰.۵ ثانیه روی بدترین پیام ۴۰۹۶ حرفی)
+MAX_MESSAGE_LENGTH = 4096
+MAX_MATCH_COST = 4 * MAX_MESSAGE_LENGTH
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None))
+
+# قوانین پیش‌فرض همه گروه‌ها؛ قوانین خود گروه اولویت بالاتری دارند
+DEFAULT_RULES = [
+    {"id": None, "kind": REGEX, "pattern": "^سلام$", "response": "سلام {name}! امیدوارم حالت خوب باشه 🌸"},
+    {"id": None, "kind": REPLY, "pattern": BOT_NAME, "response": "جانم {name}! در صورتی که کاری دارید با ادمین‌ها درمیون بزارید تا هوشمندتر بشم 🤖"},
+]
+
+# group_id -> Matcher
+_matchers = TTLCache(maxsize=RULE_CACHE_SIZE, ttl=RULE_CACHE_TTL)
+
+
+def validate_regex(pattern: str):
+    # گروه‌های نام‌دار و ارجاع به گروه‌ها با الگوی ترکیبی تداخل دارند
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return "الگو بیش از حد طولانی است."
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        return f"الگو نامعتبر است: {e}"
+    try:
+        # الگو داخل الگوی ترکیبی گروه هم باید کامپایل شود
+        re.compile(_wrap(pattern, 0))
+    except re.error:
+        return "پرچم‌های سراسری مثل (?i) پشتیبانی نمی‌شوند؛ بررسی همیشه بدون حساسیت به حروف بزرگ و کوچک است."
+    if compiled.groupindex or re.search(r"\\\d|\(\?P=", pattern):
+        return "گروه‌های نام‌دار و ارجاع به گروه پشتیبانی نمی‌شوند."
+    # بررسی روی event loop برای هر پیام اجرا می‌شود؛ الگوهایی که عقب‌گرد نمایی یا چندجمله‌ای دارند ممنوع‌اند
+    try:
+        cost = _backtracking_cost(sre_parse.parse(pattern), False)
+    except ValueError as e:
+        return str(e)
+    if cost > MAX_MATCH_COST:
+        return "الگو بیش از حد پرهزینه است؛ حداکثر یک تکرار نامحدود (مثل + یا *) و چند تکرار کوچک مجاز است."
+    return None
+
+
+def _backtracking_cost(items, repeated: bool) -> int:
+    # حاصل‌ضرب تعداد حالت‌های هر تکرار متغیر؛ تکرار نامحدود به اندازه طولانی‌ترین پیام حساب می‌شود.
+    # تکرار تو در تو یا انتخاب (|) داخل تکرار متغیر خطا می‌دهد
+    cost = 1
+    for op, av in items:
+        if op in _REPEATS:
+            low, high, body = av
+            variable = high != low
+            if variable and repeated:
+                raise ValueError("تکرار تو در تو مثل (a+)+ پشتیبانی نمی‌شود.")
+            inner = _backtracking_cost(body, repeated or variable)
+            if variable:
+                cost *= min(high - low, MAX_MESSAGE_LENGTH) + 1
+            else:
+                cost *= inner ** min(low, 64)
+        elif op is sre_parse.BRANCH:
+            if repeated:
+                raise ValueError("انتخاب (|) داخل تکرار مثل (a|b)+ پشتیبانی نمی‌شود.")
+            cost *= sum(_backtracking_cost(branch, repeated) for branch in av[1])
+        elif op is sre_parse.SUBPATTERN:
+            cost *= _backtracking_cost(av[-1], repeated)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            cost *= _backtracking_cost(av[1], repeated)
+        elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+            cost *= _backtracking_cost(av, repeated)
+        if cost > MAX_MATCH_COST:
+            break
+    return cost
+
+
+def _wrap(pattern: str, index: int) -> str:
+    return f"(?P<r{index}>(?i:{pattern}))"
+
+
+def _trie_pattern(words) -> str:
+    # کلمات ثابت به یک regex درخت‌مانند تبدیل می‌شوند تا پیشوندهای مشترک یک بار بررسی شوند
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        optional = "" in node
+        if len(alternatives) == 1 and not optional:
+            return alternatives[0]
+        body = "(?:" + "|".join(alternatives) + ")"
+        return body + "?" if optional else body
+
+    return build(trie)
+
+
+# همه قوانین یک گروه در یک regex ترکیبی؛ هزینه بررسی با تعداد قوانین تقریباً ثابت می‌ماند
+class Matcher:
+    def __init__(self, rules):
+        # ترتیب اولویت: کلمات ممنوع، قوانین گروه، قوانین پیش‌فرض
+        rules = [rule for rule in rules if rule["kind"] == BANNED] + \
+                [rule for rule in rules if rule["kind"] != BANNED] + DEFAULT_RULES
+        self._priority = {}
+        self._banned = {}
+        self._literals = {}
+        parts = []
+
+        for index, rule in enumerate(rules):
+            self._priority[id(rule)] = index
+            if not rule["pattern"]:
+                continue
+            if rule["kind"] == REGEX:
+                # قوانین ذخیره‌شده قبل از این بررسی‌ها هم دوباره سنجیده می‌شوند؛
+                # فقط همین الگو کنار گذاشته می‌شود، نه همه regexهای گروه
+                error = validate_regex(rule["pattern"])
+                if error:
+                    print(f"❌ الگوی نامعتبر کنار گذاشته شد ({rule['pattern']}): {error}")
+                    continue
+                parts.append(_wrap(rule["pattern"], index))
+            elif rule["kind"] == BANNED:
+                self._banned.setdefault(rule["pattern"].lower(), rule)
+            elif rule["pattern"].lower() not in self._banned:
+                self._literals.setdefault(rule["pattern"].lower(), rule)
+
+        self._rules = rules
+        # کلمات ممنوع جدا و قبل از بقیه جستجو می‌شوند تا تطبیق زودتر یک پاسخ یا regex آن‌ها را نپوشاند
+        self._banned_regex = re.compile(_trie_pattern(self._banned)) if self._banned else None
+        if self._literals:
+            parts.insert(0, f"(?P<lit>{_trie_pattern(self._literals)})")
+        # متن ورودی از قبل با lower() یکسان شده؛ IGNORECASE برای کل الگو بررسی را چند برابر کند می‌کند
+        self._regex = re.compile("|".join(parts)) if parts else None
+
+    def match(self, text: str):
+        if self._banned_regex is not None:
+            m = self._banned_regex.search(text)
+            if m:
+                return self._banned[m.group()]
+        if self._regex is None:
+            return None
+
+        best = None
+        for m in self._regex.finditer(text):
+            if m.lastgroup == "lit":
+                rule = self._literals.get(m.group())
+            else:
+                rule = self._rules[int(m.lastgroup[1:])]
+            if rule is None:
+                continue
+            if best is None or self._priority[id(rule)] < self._priority[id(best)]:
+                best = rule
+        return best
+
+
+def _compile(rules) -> Matcher:
+    try:
+        return Matcher(rules)
+    except re.error as e:
+        # اگر یک الگوی قدیمی خراب باشد، بقیه قوانین بدون regex‌ها کار کنند
+        print(f"❌ خطا در کامپایل قوانین: {e}")
+        return Matcher([rule for rule in rules if rule["kind"] != REGEX])
+
+
+async def get_matcher(group_id: int) -> Matcher:
+    matcher = _matchers.get(group_id)
+    if matcher is None:
+        rules = await get_group_rules(group_id)
+        if rules is None:
+            # در صورت خطای دیتابیس نسخه قبلی (یا فقط قوانین پیش‌فرض) کوتاه‌مدت استفاده شود
+            matcher = _matchers.get_stale(group_id) or _compile([])
+            _matchers.set(group_id, matcher, ttl=30)
+        else:
+            matcher = _compile(rules)
+            _matchers.set(group_id, matcher)
+    return matcher
+
+
+async def reload(group_id: int):
+    # فقط بعد از تغییر قوانین همان گروه دوباره کامپایل می‌شود
+    _matchers.pop(group_id)
+    return await get_matcher(group_id)
+
+
+def render(rule: dict, name: str) -> str:
+    return (rule.get("response") or "").replace("{name}", name)
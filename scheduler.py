@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = "Asia/Tehran"
+DEFAULT_NIGHT_START = time(2, 0)
+DEFAULT_NIGHT_END = time(7, 0)
+WARNING_BEFORE = timedelta(minutes=10)
+
+# انواع رویدادها
+UNLOCK = "unlock"
+NIGHT_WARNING = "night_warning"
+NIGHT_START = "night_start"
+NIGHT_END = "night_end"
+NIGHT_KINDS = (NIGHT_WARNING, NIGHT_START, NIGHT_END)
+
+
+def parse_utc(value: str) -> datetime:
+    # زمان‌های بدون منطقه زمانی در دیتابیس به UTC ذخیره شده‌اند
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def parse_time(value) -> time:
+    if isinstance(value, time):
+        return value
+    return time.fromisoformat(value)
+
+
+def get_zone(name: str):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def next_occurrence(local_time: time, tz: ZoneInfo, after: datetime) -> datetime:
+    local_after = after.astimezone(tz)
+    candidate = datetime.combine(local_after.date(), local_time, tzinfo=tz)
+    if candidate <= local_after:
+        candidate = datetime.combine(local_after.date() + timedelta(days=1), local_time, tzinfo=tz)
+    return candidate.astimezone(timezone.utc)
+
+
+# زمان‌بندی رویدادهای هر گروه با min-heap؛ به‌جای بررسی دوره‌ای کل جدول،
+# تا نزدیک‌ترین موعد می‌خوابد و فقط گروه‌های سررسیده را به هندلر می‌دهد
+class Scheduler:
+    def __init__(self):
+        self._heap = []
+        self._due_at = {}     # (group_id, kind) -> datetime
+        self._settings = {}   # group_id -> (tz, start, end)
+        self._handlers = {}   # kind -> async handler(list of group_id)
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._running = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def on(self, kind: str, handler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def schedule(self, group_id: int, kind: str, when: datetime):
+        when = when.astimezone(timezone.utc)
+        key = (group_id, kind)
+        self._due_at[key] = when
+        heapq.heappush(self._heap, (when, next(self._counter), group_id, kind))
+
+        # ورودی‌های باطل‌شده در heap می‌مانند؛ اگر زیاد شدند heap بازسازی می‌شود
+        if len(self._heap) > 2 * len(self._due_at) + 1024:
+            self._compact()
+
+        if self._heap[0][0] == when:
+            self._wakeup.set()
+
+    def cancel(self, group_id: int, kind: str):
+        self._due_at.pop((group_id, kind), None)
+
+    def next_deadline(self, group_id: int, kind: str):
+        return self._due_at.get((group_id, kind))
+
+    # تنظیم قفل شبانه یک گروه و زمان‌بندی هشدار، شروع و پایان آن
+    def set_night_lock(self, group_id: int, tz_name: str = None, start=None, end=None):
+        tz = get_zone(tz_name or DEFAULT_TIMEZONE) or ZoneInfo(DEFAULT_TIMEZONE)
+        start = parse_time(start) if start else DEFAULT_NIGHT_START
+        end = parse_time(end) if end else DEFAULT_NIGHT_END
+        self._settings[group_id] = (tz, start, end)
+
+        now = datetime.now(timezone.utc)
+        for kind in NIGHT_KINDS:
+            self._arm(group_id, kind, now)
+
+    def clear_night_lock(self, group_id: int):
+        self._settings.pop(group_id, None)
+        for kind in NIGHT_KINDS:
+            self.cancel(group_id, kind)
+
+    def in_night_window(self, group_id: int, now: datetime) -> bool:
+        if group_id not in self._settings:
+            return False
+        tz, start, end = self._settings[group_id]
+        local = now.astimezone(tz).time()
+        if start <= end:
+            return start <= local < end
+        # بازه‌ای که از نیمه‌شب می‌گذرد (مثلاً ۲۳:۰۰ تا ۰۷:۰۰)
+        return local >= start or local < end
+
+    def window(self, group_id: int):
+        _, start, end = self._settings.get(group_id, (None, DEFAULT_NIGHT_START, DEFAULT_NIGHT_END))
+        return start.strftime("%H:%M"), end.strftime("%H:%M")
+
+    # بارگذاری اولیه از ردیف‌های جدول groups
+    def load(self, group: dict):
+        group_id = group["group_id"]
+        if group.get("night_lock_active"):
+            self.set_night_lock(
+                group_id,
+                group.get("timezone"),
+                group.get("night_lock_start"),
+                group.get("night_lock_end")
+            )
+            now = datetime.now(timezone.utc)
+            if self.in_night_window(group_id, now):
+                # برنامه وسط بازه قفل شبانه بالا آمده؛ شروع امشب از دست نرود
+                self.schedule(group_id, NIGHT_START, now)
+        if group.get("is_locked") and group.get("lock_until"):
+            self.schedule(group_id, UNLOCK, parse_utc(group["lock_until"]))
+
+    def __len__(self):
+        return len(self._due_at)
+
+    def _arm(self, group_id: int, kind: str, after: datetime):
+        tz, start, end = self._settings[group_id]
+        if kind == NIGHT_WARNING:
+            local_time = (datetime.combine(date(2000, 1, 2), start) - WARNING_BEFORE).time()
+        elif kind == NIGHT_START:
+            local_time = start
+        else:
+            local_time = end
+        self.schedule(group_id, kind, next_occurrence(local_time, tz, after))
+
+    def _compact(self):
+        self._heap = [
+            (when, next(self._counter), group_id, kind)
+            for (group_id, kind), when in self._due_at.items()
+        ]
+        heapq.heapify(self._heap)
+
+    def _pop_due(self, now: datetime):
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            when, _, group_id, kind = heapq.heappop(self._heap)
+            if self._due_at.get((group_id, kind)) != when:
+                continue  # لغو یا جابه‌جا شده
+            del self._due_at[(group_id, kind)]
+            due.setdefault(kind, []).append(group_id)
+
+            # رویدادهای قفل شبانه برای روز بعد دوباره زمان‌بندی می‌شوند
+            if kind in NIGHT_KINDS and group_id in self._settings:
+                self._arm(group_id, kind, when)
+        return due
+
+    async def _run(self):
+        while True:
+            timeout = None
+            if self._heap:
+                timeout = max(0.0, (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            for kind, group_ids in self._pop_due(datetime.now(timezone.utc)).items():
+                handler = self._handlers.get(kind)
+                if handler:
+                    task = asyncio.create_task(self._fire(kind, handler, group_ids))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+
+    async def _fire(self, kind: str, handler, group_ids):
+        try:
+            await handler(group_ids)
+        except Exception as e:
+            print(f"❌ خطا در اجرای رویداد {kind} برای {len(group_ids)} گروه: {e}")
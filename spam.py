@@ -0,0 +1,98 @@
+import heapq
+import re
+import time
+from collections import OrderedDict
+
+from config import SPAM_GROUP_THRESHOLD, SPAM_TTL, SPAM_MAX_ENTRIES, SPAM_MIN_LENGTH, SPAM_SIMILARITY
+
+WORD = re.compile(r"[^\W\d_]+")  # فقط حروف؛ اعداد و ایموجی‌ها که در هر نسخه عوض می‌شوند حساب نمی‌شوند
+MAX_TEXT = 1000    # فقط ابتدای پیام‌های طولانی هش می‌شود
+SKETCH_SIZE = 8    # تعداد کوچک‌ترین هش‌هایی که از هر متن نگه داشته می‌شود
+BUCKET_SIZE = 16   # حداکثر متن برای هر هش؛ جفت کلمه‌های رایج هزینه جستجو را بالا نمی‌برند
+
+
+def sketch(text: str):
+    # کوچک‌ترین هش‌های جفت کلمه‌های پشت سر هم (MinHash)؛ متن‌های شبیه هش‌های مشترک زیادی دارند
+    words = WORD.findall(text[:MAX_TEXT].lower())
+    if len(words) < 2:
+        return None
+    shingles = {hash(pair) for pair in zip(words, words[1:])}
+    return tuple(heapq.nsmallest(SKETCH_SIZE, shingles))
+
+
+# اثر متن‌های اخیر همه گروه‌ها؛ متنی که (تقریباً یکسان) در چند گروه مختلف دیده شود اسپم حساب می‌شود.
+# اثرهای بیکار بعد از SPAM_TTL و قدیمی‌ترین‌ها بعد از SPAM_MAX_ENTRIES حذف می‌شوند
+class FingerprintIndex:
+    def __init__(self, threshold: int = SPAM_GROUP_THRESHOLD, ttl: float = SPAM_TTL,
+                 max_entries: int = SPAM_MAX_ENTRIES, min_length: int = SPAM_MIN_LENGTH,
+                 similarity: float = SPAM_SIMILARITY):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_length = min_length
+        self.similarity = similarity
+        # sketch -> [گروه‌ها (حداکثر threshold تا)، آخرین بازدید]
+        self._entries = OrderedDict()
+        # hash -> sketch‌هایی که این hash را دارند
+        self._buckets = {}
+
+    def add(self, chat_id: int, text: str) -> bool:
+        # ثبت متن و اینکه حالا در حداقل threshold گروه دیده شده یا نه
+        if len(text) < self.min_length:
+            return False
+        fingerprint = sketch(text)
+        if fingerprint is None:
+            return False
+
+        now = time.monotonic()
+        self._evict(now)
+
+        match = fingerprint if fingerprint in self._entries else self._find(fingerprint)
+        if match is None:
+            self._entries[fingerprint] = [(chat_id,), now]
+            for value in fingerprint:
+                bucket = self._buckets.setdefault(value, [])
+                bucket.append(fingerprint)
+                if len(bucket) > BUCKET_SIZE:
+                    del bucket[0]
+            return False
+
+        entry = self._entries[match]
+        self._entries.move_to_end(match)
+        groups = entry[0]
+        if chat_id not in groups and len(groups) < self.threshold:
+            entry[0] = groups = groups + (chat_id,)
+        entry[1] = now
+        return len(groups) >= self.threshold
+
+    def _find(self, fingerprint: tuple):
+        needed = max(1, round(len(fingerprint) * self.similarity))
+        shared = {}
+        for value in fingerprint:
+            for other in self._buckets.get(value, ()):
+                count = shared[other] = shared.get(other, 0) + 1
+                if count >= needed:
+                    return other
+        return None
+
+    def _evict(self, now: float):
+        entries = self._entries
+        while entries:
+            fingerprint, (_, last_seen) = next(iter(entries.items()))
+            if len(entries) <= self.max_entries and last_seen > now - self.ttl:
+                return
+            del entries[fingerprint]
+            for value in fingerprint:
+                bucket = self._buckets.get(value)
+                if bucket is None:
+                    continue
+                if fingerprint in bucket:
+                    bucket.remove(fingerprint)
+                if not bucket:
+                    del self._buckets[value]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+index = FingerprintIndex()
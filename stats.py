@@ -0,0 +1,179 @@
+import asyncio
+import math
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config import STATS_FLUSH_INTERVAL, STATS_TOP_CAPACITY
+from database import merge_group_activity, get_group_activity
+
+# HyperLogLog با ۲^۱۰ رجیستر (خطای حدود ۳٪)؛ رجیسترها در جدول rollup ذخیره و با max ادغام می‌شوند
+HLL_BITS = 10
+HLL_SIZE = 1 << HLL_BITS
+HLL_REST = 64 - HLL_BITS
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_SIZE)
+MASK = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    # splitmix64؛ هش پایدار بین اجراها تا رجیسترهای ذخیره‌شده قابل ادغام بمانند
+    value = (value + 0x9E3779B97F4A7C15) & MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK
+    return value ^ (value >> 31)
+
+
+def estimate_unique(registers) -> int:
+    zeros = registers.count(0)
+    estimate = HLL_ALPHA * HLL_SIZE * HLL_SIZE / sum(2.0 ** -r for r in registers)
+    if estimate <= 2.5 * HLL_SIZE and zeros:
+        # شمارش خطی برای تعدادهای کم
+        estimate = HLL_SIZE * math.log(HLL_SIZE / zeros)
+    return round(estimate)
+
+
+# آمار یک گروه در یک ساعت: تعداد پیام، رجیسترهای کاربران یکتا و پرکارترین‌ها (Space-Saving با ظرفیت ثابت)
+class HourlyActivity:
+    __slots__ = ("messages", "registers", "top")
+
+    def __init__(self):
+        self.messages = 0
+        self.registers = bytearray(HLL_SIZE)
+        self.top = {}  # user_id -> تعداد (حداکثر STATS_TOP_CAPACITY کاربر)
+
+    def add(self, user_id: int):
+        self.messages += 1
+
+        hashed = _mix(user_id)
+        index = hashed >> HLL_REST
+        rank = HLL_REST - (hashed & ((1 << HLL_REST) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+        top = self.top
+        if user_id in top:
+            top[user_id] += 1
+        elif len(top) < STATS_TOP_CAPACITY:
+            top[user_id] = 1
+        else:
+            # کم‌شمارترین جای خود را به کاربر جدید می‌دهد و شمارش او را به ارث می‌برد
+            smallest = min(top, key=top.get)
+            top[user_id] = top.pop(smallest) + 1
+
+    def merge(self, other: "HourlyActivity"):
+        self.messages += other.messages
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        for user_id, count in other.top.items():
+            self.top[user_id] = self.top.get(user_id, 0) + count
+
+    def to_row(self, group_id: int, hour: int) -> dict:
+        return {
+            "group_id": group_id,
+            "hour": datetime.fromtimestamp(hour * 3600, timezone.utc).isoformat(),
+            "messages": self.messages,
+            # فقط رجیسترهای غیر صفر؛ گروه‌های کوچک ردیف کوچکی دارند
+            "users": {str(i): r for i, r in enumerate(self.registers) if r},
+            "top": {str(user_id): count for user_id, count in self.top.items()}
+        }
+
+    @classmethod
+    def from_row(cls, row: dict) -> "HourlyActivity":
+        activity = cls()
+        activity.messages = row.get("messages") or 0
+        for index, rank in (row.get("users") or {}).items():
+            activity.registers[int(index)] = rank
+        activity.top = {int(user_id): count for user_id, count in (row.get("top") or {}).items()}
+        return activity
+
+
+# (group_id, ساعت از epoch) -> HourlyActivity؛ فقط تغییرهای بعد از آخرین ارسال
+_pending = {}
+# (request_id, دسته) ارسال‌شده‌ای که موفقیتش تأیید نشده؛ با همان شناسه دوباره فرستاده می‌شود تا
+# اگر بار قبل در Supabase ثبت شده بود دو بار شمرده نشود. لغو وسط ارسال هم آن را از بین نمی‌برد
+_unsent = None
+_flusher: asyncio.Task = None
+_flush_lock = asyncio.Lock()
+
+
+def record(group_id: int, user_id: int):
+    key = (group_id, int(time.time()) // 3600)
+    activity = _pending.get(key)
+    if activity is None:
+        activity = _pending[key] = HourlyActivity()
+    activity.add(user_id)
+
+
+async def flush():
+    global _pending, _unsent
+    async with _flush_lock:
+        while _unsent is not None or _pending:
+            if _unsent is None:
+                _unsent = (str(uuid.uuid4()), _pending)
+                _pending = {}
+            request_id, batch = _unsent
+            rows = [activity.to_row(group_id, hour) for (group_id, hour), activity in batch.items()]
+            if not await merge_group_activity(rows, request_id):
+                print(f"⚠️ ارسال آمار {len(rows)} گروه-ساعت ناموفق بود؛ دفعه بعد دوباره ارسال می‌شود.")
+                return False
+            _unsent = None
+        return True
+
+
+def pending() -> int:
+    return len(_pending) + (len(_unsent[1]) if _unsent else 0)
+
+
+def start():
+    global _flusher
+    if _flusher is None:
+        _flusher = asyncio.create_task(_flush_forever())
+
+
+async def stop(timeout: float = 5):
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        await asyncio.gather(_flusher, return_exceptions=True)
+        _flusher = None
+    try:
+        await asyncio.wait_for(flush(), timeout)
+    except Exception as e:
+        print(f"⚠️ ارسال نهایی آمار ناموفق بود: {e}")
+
+
+async def _flush_forever():
+    while True:
+        await asyncio.sleep(STATS_FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as e:
+            print(f"❌ خطا در ارسال آمار: {e}")
+
+
+async def summary(group_id: int, hours: int = 24):
+    # rollupهای ذخیره‌شده به‌علاوه تغییرهای هنوز ارسال‌نشده؛ None یعنی خواندن ناموفق بود
+    first_hour = int(time.time()) // 3600 - hours + 1
+    since = datetime.fromtimestamp(first_hour * 3600, timezone.utc).isoformat()
+    rows = await get_group_activity(group_id, since)
+    if rows is None:
+        return None
+
+    by_hour = {}
+    for row in rows:
+        hour = int(datetime.fromisoformat(row["hour"]).timestamp()) // 3600
+        by_hour[hour] = HourlyActivity.from_row(row)
+    unsent = list(_unsent[1].items()) if _unsent else []
+    for (pending_group, hour), activity in unsent + list(_pending.items()):
+        if pending_group == group_id and hour >= first_hour:
+            by_hour.setdefault(hour, HourlyActivity()).merge(activity)
+
+    total = HourlyActivity()
+    for activity in by_hour.values():
+        total.merge(activity)
+
+    return {
+        "messages": total.messages,
+        "unique_users": estimate_unique(total.registers) if total.messages else 0,
+        "hourly": {hour: activity.messages for hour, activity in sorted(by_hour.items())},
+        "top": sorted(total.top.items(), key=lambda item: item[1], reverse=True)
+    }
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+# config مقادیر را هنگام import می‌خواند؛ تست‌ها بدون Supabase و تلگرام واقعی اجرا می‌شوند
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("SUPABASE_URL", "http://postgrest.test")
+os.environ.setdefault("SUPABASE_API_KEY", "test")
+os.environ.setdefault("RENDER_EXTERNAL_HOSTNAME", "test.local")
+os.environ["LOCAL_STORE_PATH"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from bench import fake_postgrest  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def postgrest():
+    # database.py مستقیم به PostgREST شبیه‌سازی‌شده وصل می‌شود
+    fake_postgrest.reset()
+    database._client = httpx.AsyncClient(
+        base_url=f"{os.environ['SUPABASE_URL']}/rest/v1",
+        transport=httpx.ASGITransport(app=fake_postgrest.app)
+    )
+    yield fake_postgrest
+    await database.close_client()
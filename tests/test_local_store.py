@@ -0,0 +1,40 @@
+import pytest
+
+import database
+from config import REPLICATION_BATCH
+from local_store import LocalStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = LocalStore(str(tmp_path / "store.db"))
+    monkeypatch.setattr(database, "store", store)
+    return store
+
+
+def backlog_for(store, group_id):
+    return store._db.execute("select count(*) from journal where group_id = ?", (group_id,)).fetchone()[0]
+
+
+def test_group_waiting_on_retry_does_not_fill_the_batch(store):
+    for user_id in range(REPLICATION_BATCH + 10):
+        store.change_warning(-1, user_id, 1)
+    store.change_warning(-2, 1, 1)
+    first_id = store.pending(1)[0][0]
+    store.retry_later(first_id, 0)
+
+    assert [group_id for _, _, group_id, _, _ in store.pending(REPLICATION_BATCH)] == [-2]
+
+
+@pytest.mark.anyio
+async def test_other_groups_replicate_while_one_backs_off(store, postgrest):
+    for user_id in range(REPLICATION_BATCH + 10):
+        store.change_warning(-1, user_id, 1)
+    store.change_warning(-2, 1, 1)
+    store.retry_later(store.pending(1)[0][0], 0)
+
+    await database.replicate_pending()
+
+    assert backlog_for(store, -2) == 0
+    assert backlog_for(store, -1) == REPLICATION_BATCH + 10
+    assert [row["group_id"] for row in postgrest.tables["warnings"]] == [-2]
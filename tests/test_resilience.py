@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import metrics
+import resilience
+
+
+# پاسخ‌های Supabase به ترتیب: (تأخیر، کد وضعیت)
+@pytest.fixture
+def upstream(monkeypatch):
+    replies = []
+
+    async def handle(self, request):
+        delay, status = replies.pop(0)
+        await asyncio.sleep(delay)
+        return httpx.Response(status, json=[], request=request)
+
+    monkeypatch.setattr(metrics.SupabaseTransport, "handle_async_request", handle)
+    monkeypatch.setattr(resilience, "SUPABASE_CALL_DEADLINE", 0.5)
+    monkeypatch.setattr(resilience, "breakers", {})
+    monkeypatch.setattr(resilience, "budget", resilience.RetryBudget())
+    return replies
+
+
+async def call(method="GET"):
+    async with httpx.AsyncClient(base_url="http://supabase.test/rest/v1", transport=resilience.ResilientTransport()) as client:
+        return await client.request(method, "/groups")
+
+
+@pytest.mark.anyio
+async def test_retry_is_cut_at_call_deadline(upstream):
+    # تلاش اول 0.3 ثانیه و 503؛ تلاش دوم بدون سقف 2 ثانیه طول می‌کشید
+    upstream.extend([(0.3, 503), (2, 200)])
+
+    started = time.monotonic()
+    with pytest.raises(resilience.DeadlineExceeded):
+        await call()
+
+    assert time.monotonic() - started < 0.7
+    assert resilience.breakers["groups"].failures == 2
+
+
+@pytest.mark.anyio
+async def test_single_slow_attempt_is_cut_at_call_deadline(upstream):
+    upstream.append((2, 200))
+
+    started = time.monotonic()
+    with pytest.raises(httpx.TimeoutException):
+        await call("POST")
+
+    assert time.monotonic() - started < 0.7
+
+
+@pytest.mark.anyio
+async def test_fast_retry_still_succeeds(upstream):
+    upstream.extend([(0, 503), (0, 200)])
+
+    response = await call()
+
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+import rules
+
+
+def rule(rule_id, kind, pattern, response="پاسخ"):
+    return {"id": rule_id, "kind": kind, "pattern": pattern, "response": response}
+
+
+def test_group_rules_take_priority_over_defaults():
+    matcher = rules.Matcher([rule(1, rules.REPLY, rules.BOT_NAME, "پاسخ گروه")])
+
+    assert matcher.match(f"سلام {rules.BOT_NAME}")["id"] == 1
+    assert matcher.match("سلام")["response"] == rules.DEFAULT_RULES[0]["response"]
+    assert matcher.match("متن دیگر") is None
+
+
+def test_earlier_rule_wins_when_several_match():
+    matcher = rules.Matcher([
+        rule(1, rules.REGEX, r"ساعت\s*چند"),
+        rule(2, rules.REPLY, "چند"),
+    ])
+
+    assert matcher.match("ساعت چند است")["id"] == 1
+    assert matcher.match("چند تا")["id"] == 2
+
+
+@pytest.mark.parametrize("text", ["buy spam now", "pricesex", "price then spam"])
+def test_banned_word_is_found_behind_earlier_matches(text):
+    matcher = rules.Matcher([
+        rule(1, rules.REGEX, r"buy\s+\w+"),
+        rule(2, rules.REPLY, "price"),
+        rule(3, rules.BANNED, "spam"),
+        rule(4, rules.BANNED, "cesex"),
+    ])
+
+    assert matcher.match(text)["kind"] == rules.BANNED
+
+
+def test_banned_word_shadows_reply_with_same_pattern():
+    matcher = rules.Matcher([rule(1, rules.REPLY, "spam"), rule(2, rules.BANNED, "Spam")])
+
+    assert matcher.match("spam")["id"] == 2
+
+
+@pytest.mark.parametrize("pattern", ["(?i)hello", "(?s)a.b"])
+def test_inline_global_flags_are_rejected(pattern):
+    assert rules.validate_regex(pattern) is not None
+
+
+@pytest.mark.parametrize("pattern", [r"ساعت\s*چند", r"^سلام$", r"(?:\d{1,3}\.){3}\d{1,3}", r"قیمت|price"])
+def test_simple_patterns_are_accepted(pattern):
+    assert rules.validate_regex(pattern) is None
+
+
+@pytest.mark.parametrize("pattern", [r"(\w+\s?)+$", r"(a+)+b", r"(a|aa)+$", r"(a?){20}a{20}", r"\s*\s*x", r"a.*b.*c"])
+def test_backtracking_patterns_are_rejected(pattern):
+    assert rules.validate_regex(pattern) is not None
+
+
+def test_stored_bad_regex_is_skipped_alone():
+    matcher = rules.Matcher([
+        rule(1, rules.REGEX, "(?i)hello"),
+        rule(2, rules.REGEX, r"(\w+\s?)+$"),
+        rule(3, rules.REGEX, "wor+ld"),
+    ])
+
+    started = time.perf_counter()
+    assert matcher.match("a" * 24 + "!") is None
+    assert time.perf_counter() - started < 0.5
+    assert matcher.match("world")["id"] == 3
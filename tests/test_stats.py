@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import database
+import stats
+from bench import fake_postgrest
+
+
+# پاسخ rpc/merge_group_activity بعد از اعمال شدن در PostgREST گم می‌شود (یا درخواست معطل می‌ماند)
+class FlakyTransport(httpx.ASGITransport):
+    def __init__(self):
+        super().__init__(app=fake_postgrest.app)
+        self.lose_responses = 0
+        self.hang = None
+
+    async def handle_async_request(self, request):
+        if self.hang is not None:
+            await self.hang.wait()
+        response = await super().handle_async_request(request)
+        if self.lose_responses:
+            self.lose_responses -= 1
+            raise httpx.ReadTimeout("response lost", request=request)
+        return response
+
+
+@pytest.fixture
+async def transport():
+    fake_postgrest.reset()
+    stats._pending.clear()
+    stats._unsent = None
+    transport = FlakyTransport()
+    database._client = httpx.AsyncClient(base_url=f"{os.environ['SUPABASE_URL']}/rest/v1", transport=transport)
+    yield transport
+    await database.close_client()
+
+
+def stored_messages():
+    return sum(row["messages"] for row in fake_postgrest.tables["group_activity_hourly"])
+
+
+@pytest.mark.anyio
+async def test_lost_response_is_not_merged_twice(transport):
+    for user_id in range(10):
+        stats.record(-100, user_id)
+    transport.lose_responses = 1
+
+    assert await stats.flush() is False
+    assert stats.pending() == 1
+    stats.record(-100, 1)
+    assert await stats.flush() is True
+
+    assert stored_messages() == 11
+    assert stats.pending() == 0
+
+
+@pytest.mark.anyio
+async def test_cancelled_flush_keeps_the_batch(transport):
+    stats.record(-100, 1)
+    transport.hang = asyncio.Event()
+    task = asyncio.create_task(stats.flush())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    transport.hang = None
+    assert stats.pending() == 1
+    assert await stats.flush() is True
+    assert stored_messages() == 1
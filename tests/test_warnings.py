@@ -0,0 +1,85 @@
+import asyncio
+import os
+import pathlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import database
+
+MIGRATIONS = pathlib.Path(__file__).resolve().parent.parent / "migrations"
+CONCURRENT_WARNINGS = 50
+
+
+# اخطارهای همزمان یک کاربر از طریق rpc/change_warning؛ هر فراخوانی تعداد جدید و یکتایی می‌گیرد
+@pytest.mark.anyio
+async def test_concurrent_add_warning_counts_are_distinct(postgrest):
+    counts = await asyncio.gather(*(
+        database.add_warning(-100, 7, "user") for _ in range(CONCURRENT_WARNINGS)
+    ))
+
+    assert sorted(counts) == list(range(1, CONCURRENT_WARNINGS + 1))
+    assert await database.get_warning_count(-100, 7) == CONCURRENT_WARNINGS
+    assert postgrest.calls[("POST", "rpc/change_warning")] == CONCURRENT_WARNINGS
+
+
+@pytest.mark.anyio
+async def test_remove_warning_never_goes_below_zero(postgrest):
+    await database.add_warning(-100, 7, "user")
+
+    assert await database.remove_warning(-100, 7, 3) == 0
+    assert await database.remove_warning(-100, 8) == 0
+    assert await database.get_warning_count(-100, 7) == 0
+
+
+# همان بررسی روی Postgres واقعی با migrations/002 (و سپس 010):
+#   TEST_DATABASE_URL=postgresql://... python -m pytest tests
+@pytest.fixture
+def postgres():
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL تنظیم نشده است")
+    psycopg = pytest.importorskip("psycopg")
+
+    with psycopg.connect(url, autocommit=True) as conn:
+        schema = f"test_{uuid.uuid4().hex[:8]}"
+        conn.execute(f"create schema {schema}")
+        conn.execute(f"set search_path to {schema}")
+        conn.execute(
+            "create table warnings (group_id bigint, user_id bigint, username text, "
+            "count integer not null default 0, last_warning timestamptz)"
+        )
+        conn.execute((MIGRATIONS / "002_warnings_atomic.sql").read_text())
+        try:
+            yield psycopg, url, schema
+        finally:
+            conn.execute(f"drop schema {schema} cascade")
+
+
+def test_change_warning_sql_is_atomic(postgres):
+    psycopg, url, schema = postgres
+
+    def warn(_):
+        with psycopg.connect(url, autocommit=True) as conn:
+            conn.execute(f"set search_path to {schema}")
+            return conn.execute("select change_warning(-100, 7, 'user', 1)").fetchone()[0]
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        counts = list(pool.map(warn, range(CONCURRENT_WARNINGS)))
+
+    assert sorted(counts) == list(range(1, CONCURRENT_WARNINGS + 1))
+
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f"set search_path to {schema}")
+        assert conn.execute("select change_warning(-100, 7, 'user', -100)").fetchone()[0] == 0
+        assert conn.execute("select change_warning(-100, 8, 'user', -1)").fetchone()[0] == 0
+
+        # 010 همان تابع را با کلید تکرار جایگزین می‌کند
+        conn.execute((MIGRATIONS / "010_warning_request_ids.sql").read_text())
+        request_id = str(uuid.uuid4())
+        for _ in range(2):
+            count = conn.execute(
+                "select change_warning(-100, 7, 'user', 1, %s::uuid)", (request_id,)
+            ).fetchone()[0]
+        assert count == 1
@@ -0,0 +1,71 @@
+import asyncio
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import Application
+
+
+# صف محدود آپدیت‌ها با چند worker همزمان؛
+# آپدیت‌های هر چت همیشه به یک worker می‌رسند تا ترتیبشان حفظ شود
+class UpdateQueue:
+    def __init__(self, application: Application, workers: int, max_depth: int):
+        self.application = application
+        self.max_depth = max_depth
+        self.depth = 0
+        self.rejected = 0
+        self._queues = [asyncio.Queue() for _ in range(workers)]
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def stop(self, timeout: float = 10):
+        for queue in self._queues:
+            queue.put_nowait(None)
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def submit(self, update: Update) -> bool:
+        if self.depth >= self.max_depth:
+            self.rejected += 1
+            return False
+
+        chat = update.effective_chat
+        key = chat.id if chat else update.update_id
+        self._queues[hash(key) % len(self._queues)].put_nowait(update)
+        self.depth += 1
+        return True
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            if update is None:
+                return
+            try:
+                await self.application.process_update(update)
+            except Exception as e:
+                print(f"❌ خطا در پردازش آپدیت {update.update_id}: {e}")
+            finally:
+                self.depth -= 1
+
+
+# شناسه آپدیت‌های پذیرفته‌شده اخیر؛ تلگرام وقتی پاسخ وبهوک دیر برسد یا خطا بگیرد همان آپدیت را دوباره می‌فرستد
+class SeenUpdates:
+    def __init__(self, size: int):
+        self.size = size
+        self.duplicates = 0
+        self._ids = OrderedDict()
+
+    def seen(self, update_id: int) -> bool:
+        if update_id in self._ids:
+            self.duplicates += 1
+            return True
+        return False
+
+    def add(self, update_id: int):
+        self._ids[update_id] = None
+        if len(self._ids) > self.size:
+            self._ids.popitem(last=False)
@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime
+
+from telegram import Bot, Chat
+
+import fanout
+from config import WELCOME_WINDOW, WELCOME_MAX_BATCH
+from database import get_group
+from scheduler import get_zone, DEFAULT_TIMEZONE
+
+# سقف کاربر در یک پیام تا متن از محدودیت طول تلگرام بیشتر نشود
+MAX_BATCH_LIMIT = 50
+
+# chat_id -> {"users": {user_id: user}, "title": ..., "tz": ..., "task": ...}
+_pending = {}
+
+
+# ورودهای یک بازه کوتاه در یک پیام خوش‌آمد جمع می‌شوند
+async def add_members(bot: Bot, chat: Chat, users):
+    group = await get_group(chat.id) or {}
+    window = group.get("welcome_window") or WELCOME_WINDOW
+    max_batch = min(group.get("welcome_batch") or WELCOME_MAX_BATCH, MAX_BATCH_LIMIT)
+
+    batch = _pending.get(chat.id)
+    if batch is None:
+        batch = _pending[chat.id] = {
+            "users": {},
+            "title": chat.title,
+            "tz": group.get("timezone") or DEFAULT_TIMEZONE,
+            "task": asyncio.create_task(_flush_later(bot, chat.id, window))
+        }
+
+    for user in users:
+        batch["users"][user.id] = user
+
+    if len(batch["users"]) >= max_batch:
+        batch["task"].cancel()
+        await _flush(bot, chat.id, max_batch)
+
+
+async def _flush_later(bot: Bot, chat_id: int, window: float):
+    await asyncio.sleep(window)
+    await _flush(bot, chat_id, MAX_BATCH_LIMIT)
+
+
+async def _flush(bot: Bot, chat_id: int, max_batch: int):
+    batch = _pending.pop(chat_id, None)
+    if not batch:
+        return
+
+    users = list(batch["users"].values())
+    now = datetime.now(get_zone(batch["tz"]) or get_zone(DEFAULT_TIMEZONE)).strftime("%Y/%m/%d ساعت %H:%M")
+
+    for i in range(0, len(users), max_batch):
+        try:
+            await fanout.call(
+                chat_id,
+                bot.send_message,
+                chat_id=chat_id,
+                text=welcome_text(users[i:i + max_batch], batch["title"], now),
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            print(f"❌ خطا در ارسال خوش‌آمد به گروه {chat_id}: {e}")
+
+
+async def flush_all(bot: Bot):
+    for chat_id, batch in list(_pending.items()):
+        batch["task"].cancel()
+        await _flush(bot, chat_id, MAX_BATCH_LIMIT)
+
+
+def welcome_text(users, group_title, now) -> str:
+    if len(users) == 1:
+        return (
+            f"🌸 سلام {users[0].mention_html()} عزیز! 👋\n\n"
+            f"به گپ {group_title} خوش اومدی! 🎉\n\n"
+            f"🕒 تاریخ و زمان ورود: {now} 🌹"
+        )
+
+    mentions = "، ".join(user.mention_html() for user in users)
+    return (
+        f"🌸 سلام {mentions} عزیز! 👋\n\n"
+        f"به گپ {group_title} خوش اومدید! 🎉\n\n"
+        f"🕒 تاریخ و زمان ورود: {now} 🌹"
+    )